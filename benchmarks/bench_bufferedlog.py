@@ -0,0 +1,64 @@
+# Benchmark of the FLSTLOG overhead on the sim thread at 1k exits per minute
+# Compares writing each update's rows directly (as the BlueSky data loggers do)
+# with the buffered log, which hands full column buffers to a writer thread.
+# Run from the repository root: python benchmarks/bench_bufferedlog.py
+
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+root = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, root)
+from bluesky.plugins.bufferedlog import BufferedLog
+
+class DirectLog:
+    ''' Formats and writes the rows of every call right away, with numpy text
+        conversion and savetxt like the BlueSky data loggers. '''
+    def __init__(self, fname):
+        self.f = open(fname, 'w')
+
+    def log(self, t, *cols):
+        cols = np.broadcast_arrays(t, *(np.asarray(col) for col in cols))
+        txt = [np.char.mod('%.6f', col) if col.dtype == float else col.astype(str) for col in cols]
+        np.savetxt(self.f, np.column_stack(txt), fmt='%s', delimiter=',')
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+def exits(rng, n):
+    ''' Columns of one FLSTLOG call for n exiting aircraft. '''
+    ids = np.array([f'D{i}' for i in rng.integers(0, 100000, n)])
+    return [ids] + [rng.random(n) for _ in range(16)] + [rng.random(n) < 0.5]
+
+def run(logger, rate, duration, seed=1):
+    ''' Time spent in each log call on the sim thread, for rate exits/minute logged
+        at 1 Hz, and the time to write the remaining rows at the end. '''
+    rng = np.random.default_rng(seed)
+    # Columns are drawn up front, only the logging is timed
+    calls = [exits(rng, n) for n in rng.poisson(rate / 60.0, int(duration))]
+    tcall = np.zeros(len(calls))
+    for t, cols in enumerate(calls):
+        start = time.perf_counter()
+        logger.log(float(t), *cols)
+        tcall[t] = time.perf_counter() - start
+    start = time.perf_counter()
+    logger.close()
+    return tcall, time.perf_counter() - start, sum(len(cols[0]) for cols in calls)
+
+if __name__ == '__main__':
+    duration = 3600.0
+    print(f"{'exits/min':>9} {'logger':>9} {'rows':>7} {'sim thread [ms]':>16} "
+          f"{'per update [us]':>16} {'max [us]':>9} {'close [ms]':>11}")
+    with tempfile.TemporaryDirectory() as path:
+        for rate in (1000, 10000):
+            direct = DirectLog(os.path.join(path, 'direct.log'))
+            buffered = BufferedLog('FLSTLOG', 'FLST LOG', path)
+            buffered.start('BENCH')
+            for name, logger in (('direct', direct), ('buffered', buffered)):
+                tcall, tclose, rows = run(logger, rate, duration)
+                print(f'{rate:9d} {name:>9} {rows:7d} {1e3 * tcall.sum():16.1f} '
+                      f'{1e6 * tcall.mean():16.1f} {1e6 * tcall.max():9.0f} {1e3 * tclose:11.1f}')
@@ -0,0 +1,77 @@
+# Benchmark of the multi-airport zone check, airports x drones
+# Compares checking every aircraft against every zone of every airport with one
+# query of the spatial index over all zones (OLSINDEX), and the per effector type
+# check of AirportOLS without and with the coverage raster (OLSRASTER).
+# Run from the repository root: python benchmarks/bench_multi_airport.py
+
+import copy
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+root = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, root)
+from bluesky.plugins.olszones import Site
+
+with open(os.path.join(root, 'scenario', 'sites', 'WIII.json')) as f:
+    wiii = json.load(f)
+
+def shifted(cfg, dlat, dlon, name):
+    ''' Copy of an airport moved by (dlat, dlon), with unique zone and site names. '''
+    apt = copy.deepcopy(cfg)
+    apt['name'] = name
+    apt['centre'] = [apt['centre'][0] + dlat, apt['centre'][1] + dlon]
+    apt['runways'] = {rwy: [lat + dlat, lon + dlon] for rwy, (lat, lon) in apt['runways'].items()}
+    apt['exclusion']['name'] += name
+    apt['exclusion']['coords'] = [[lat + dlat, lon + dlon] for lat, lon in apt['exclusion']['coords']]
+    for site in apt['effectors'] + apt['sensors']:
+        site['name'] += name
+        site['lat'] += dlat
+        site['lon'] += dlon
+    return apt
+
+def multisite(nairports, spacing=0.4):
+    ''' Site with nairports copies of WIII on a square grid, spacing in degrees. '''
+    n = int(np.ceil(np.sqrt(nairports)))
+    airports = [shifted(wiii, (k // n) * spacing, (k % n) * spacing, f'A{k:02d}') for k in range(nairports)]
+    return Site({'name': 'BENCH', 'airports': airports})
+
+def traffic(site, n, rng):
+    ''' Drones spread uniformly over the bounding box of all airports, 15 km margin. '''
+    lat = [apt[1] for apt in site.zones]
+    lon = [apt[2] for apt in site.zones]
+    return rng.uniform(min(lat) - 0.135, max(lat) + 0.135, n), rng.uniform(min(lon) - 0.135, max(lon) + 0.135, n)
+
+def timeit(func, *args, repeat=5):
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(1)
+    print(f"{'airports':>8} {'zones':>6} {'drones':>8} {'all zones [ms]':>15} {'index [ms]':>11} "
+          f"{'effectors [ms]':>15} {'raster [ms]':>12}")
+    for nairports in (1, 4, 16):
+        site = multisite(nairports)
+        for n in (1000, 10000):
+            lat, lon = traffic(site, n, rng)
+            x, y = site.frame.project(lat, lon)
+            assert np.array_equal(site.all_zones.membership(x, y), site.all_zones.query(x, y))
+            tall = timeit(site.all_zones.membership, x, y)
+            tidx = timeit(site.all_zones.query, x, y)
+
+            site.set_index(False)
+            site.set_raster(None)
+            groups = site.effector_groups(lat, lon)
+            teff = timeit(site.effector_groups, lat, lon)
+            site.set_raster(200.0)
+            assert np.array_equal(groups, site.effector_groups(lat, lon))
+            tras = timeit(site.effector_groups, lat, lon)
+            print(f"{nairports:>8} {len(site.all_zones):>6} {n:>8} {tall*1e3:>15.3f} {tidx*1e3:>11.3f} "
+                  f"{teff*1e3:>15.3f} {tras*1e3:>12.3f}")
@@ -0,0 +1,70 @@
+# Benchmark of the AirportOLS zone membership check, per 0.05 s tick
+# Compares the old per-runway Point/within loops with the single vectorised pass,
+# with and without the coverage raster (OLSRASTER), per effector type as AirportOLS
+# uses it. The old loops used circles in degrees, the zones are now metric circles,
+# so the agreement is reported as well.
+# Run from the repository root: python benchmarks/bench_ols_membership.py
+
+import os
+import sys
+import time
+
+import numpy as np
+from shapely import Point, Polygon
+
+root = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, root)
+from bluesky.plugins.olszones import load_site
+
+# WIII effector sites and the SQUARE exclusion polygon, as in AirportOLS
+site = load_site(os.path.join(root, 'scenario', 'sites', 'WIII.json'))
+latc, lonc = site.latc, site.lonc
+buffers = [Point(lat, lon).buffer(4/111.111) for lat, lon in zip(site.efflat, site.efflon)]
+polygon = Polygon(site.exclusions[0][-1])
+
+def traffic(n, rng):
+    ''' Drones spread uniformly over the 15 km spawn circle around WIII. '''
+    r = 15/111.111 * np.sqrt(rng.random(n))
+    theta = 2 * np.pi * rng.random(n)
+    return latc + r * np.cos(theta), lonc + r * np.sin(theta)
+
+def legacy(lat, lon):
+    ''' The four check_circle_* loops: two within() calls per runway. '''
+    inside = np.zeros((len(lat), len(buffers) + 1), dtype=bool)
+    for k, buffer in enumerate(buffers):
+        for i in range(len(lat)):
+            coord = Point(lat[i], lon[i])
+            inside[i, k] = coord.within(buffer)
+            inside[i, -1] = coord.within(polygon)
+    return inside
+
+def timeit(func, *args, repeat=5):
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def groups(inside):
+    ''' Per effector type and exclusion polygon columns of a membership matrix, as AirportOLS uses them. '''
+    return np.column_stack([inside[:, :-1][:, site.weapons == weapon].any(axis=1)
+                            for weapon in site.weapon_types] + [inside[:, -1]])
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(1)
+    print(f"{'drones':>8} {'legacy [ms]':>12} {'vectorised [ms]':>16} {'raster [ms]':>12} {'agreement':>10}")
+    for n in (1000, 10000):
+        lat, lon = traffic(n, rng)
+        expected = groups(legacy(lat, lon))
+        tleg = timeit(legacy, lat, lon, repeat=1 if n > 1000 else 3)
+
+        site.set_raster(None)
+        inside = site.effector_groups(lat, lon)
+        agreement = np.mean(inside == expected)
+        tvec = timeit(site.effector_groups, lat, lon)
+
+        site.set_raster(100.0)
+        assert np.array_equal(inside, site.effector_groups(lat, lon))
+        tras = timeit(site.effector_groups, lat, lon)
+        print(f"{n:>8} {tleg*1e3:>12.2f} {tvec*1e3:>16.3f} {tras*1e3:>12.3f} {agreement:>10.4%}")
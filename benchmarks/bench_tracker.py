@@ -0,0 +1,55 @@
+# Benchmark of the vectorised multi-sensor tracker at 1k and 5k targets
+# Drones fly straight lines at constant speed, and are painted by rotating
+# sensors with noisy plots. All plots of a tick are processed in one batch.
+# Run from the repository root: python benchmarks/bench_tracker.py
+
+import os
+import sys
+import time
+
+import numpy as np
+
+root = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, root)
+from bluesky.plugins.olstracker import Tracker
+
+def run(n, nsens=4, rotation=4.0, dt=0.05, duration=40.0, sigma=25.0, seed=1):
+    ''' Track n drones over duration seconds, returns the timings and track quality. '''
+    rng = np.random.default_rng(seed)
+    size = 4000.0 * np.sqrt(n)          # Keeps the traffic density constant
+    pos = rng.uniform(-size / 2, size / 2, (n, 2))
+    spd = rng.uniform(5.0, 30.0, n)
+    hdg = rng.uniform(0.0, 2 * np.pi, n)
+    vel = np.column_stack((spd * np.sin(hdg), spd * np.cos(hdg)))
+    # Time in the rotation at which each sensor paints each drone
+    phase = rng.uniform(0.0, rotation, (n, nsens))
+
+    tracker = Tracker(r=sigma)
+    tupdate, nplots = 0.0, 0
+    for k in range(int(duration / dt)):
+        t0, t1 = k * dt, (k + 1) * dt
+        ahead = (phase - t0) % rotation
+        iac, isens = np.nonzero(ahead < dt)
+        tplot = t0 + ahead[iac, isens]
+        z = pos[iac] + vel[iac] * (tplot - t0)[:, np.newaxis] + rng.normal(0.0, sigma, (len(iac), 2))
+        order = np.argsort(tplot)
+
+        start = time.perf_counter()
+        tracker.update(tplot[order], z[order, 0], z[order, 1], iac[order])
+        tracker.prune(t1)
+        tupdate += time.perf_counter() - start
+        nplots += len(iac)
+        pos += vel * dt
+
+    x, y, label, _ = tracker.positions(duration)
+    err = np.hypot(x - pos[label, 0], y - pos[label, 1])
+    tracked = len(np.unique(label))
+    return tupdate, nplots, len(tracker), tracked, np.sqrt(np.mean(err ** 2))
+
+if __name__ == '__main__':
+    print(f"{'targets':>8} {'tracks':>7} {'tracked':>8} {'plots/s':>9} "
+          f"{'ms/tick':>8} {'plots/s cpu':>12} {'rms [m]':>8}")
+    for n in (1000, 5000):
+        tupdate, nplots, ntracks, tracked, rms = run(n)
+        print(f'{n:8d} {ntracks:7d} {tracked / n:8.1%} {nplots / 40.0:9.0f} '
+              f'{1e3 * tupdate / 800:8.2f} {nplots / tupdate:12.0f} {rms:8.1f}')
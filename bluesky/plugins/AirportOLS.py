@@ -1,16 +1,29 @@
-# Plugin to terminate a flight when entering a restricted airspace (Zone A) at Jakarta's WIII airport
+# Plugin to terminate a flight when entering a restricted airspace (Zone A) at an airport
+# The airport, its zones and the effector sites are read from a site file (scenario/sites).
+# Use OLSSITE WIII_outside for the effectors outside of the WIII airport perimeter.
+# With OLSTRACKS ON the effectors engage the tracks of SensorDetection instead of the true positions.
 # Written by FreezingFalcon
 
-from bluesky import core, traf, stack, sim, tools
-from bluesky.tools import datalog, areafilter
-from bluesky.tools.geo import *
-from shapely import *
+from bluesky import core, traf, stack, sim, settings
+from bluesky.tools.aero import fpm
+from bluesky.plugins.olszones import load_site, ZoneScheduler
+from bluesky.plugins.stableuid import stable_uids
 
-import time
-import datetime
+import os
+import numpy as np
 
-def unix_to_datetime(unix_timestamp):
-    return datetime.datetime.fromtimestamp(int(unix_timestamp))
+def force_land(idx):
+    ''' Make all aircraft in idx descend to the ground at 1000 fpm and stop,
+        as the ALT id, 0, -1000 and SPD id, 0 commands do for one aircraft. '''
+    traf.selalt[idx] = 0.0
+    traf.selvs[idx] = -1000.0 * fpm
+    traf.swvnav[idx] = False
+    traf.selspd[idx] = 0.0
+    traf.swvnavspd[idx] = False
+
+def shoot_down(idx):
+    ''' Remove all aircraft in idx from the simulation in one call. '''
+    traf.delete(idx)
 
 def init_plugin():
 
@@ -29,310 +42,185 @@ def init_plugin():
 
 class AirportOLS(core.Entity):
     def __init__(self):
-        self.radius = 10000
-        self.latc = -6.1264
-        self.lonc = 106.6547
-        self.lat25L = -6.129701
-        self.lon25L =  106.674772
-        self.lat25R = -6.108223
-        self.lon25R = 106.669058
-        self.lat07L = -6.121538
-        self.lon07L = 106.637583
-        self.lat07R = -6.142669
-        self.lon07R = 106.643556
-        self.latE25L = -6.127992
-        self.lonE25L = 106.685071
-        self.latE25R = -6.099304
-        self.lonE25R = 106.677291
-        self.latE07L = -6.116856
-        self.lonE07L = 106.634743
-        self.latE07R = -6.148298
-        self.lonE07R = 106.633058
-        self.density = 1000
-        self.mdens = 0
-        self.lat_cc, self.lon_cc = 0, 0
-        self.standardtime = time.time()
-        headerr = "density,latitude,longitude,id,time"
-        self.loggedstuff = datalog.crelog("CircleSpawnLog", None, headerr)
-        
-        # Create a point and circle buffers to check the drone intrusion
-        self.circle_center = Point(self.latc, self.lonc)
-        self.circle_buffer = self.circle_center.buffer(4/111.111)
-
-        self.R25L_center = Point(self.lat25L, self.lon25L)
-        self.R25L_buffer = self.R25L_center.buffer(4/111.111)
-
-        self.R25R_center = Point(self.lat25R, self.lon25R)
-        self.R25R_buffer = self.R25R_center.buffer(4/111.111)
-
-        self.R07L_center = Point(self.lat07L, self.lon07L)
-        self.R07L_buffer = self.R07L_center.buffer(4/111.111)
-
-        self.R07R_center = Point(self.lat07R, self.lon07R)
-        self.R07R_buffer = self.R07R_center.buffer(4/111.111)
-        
-        # Create points within the airport to position the effectors (within airport perimeters)
-        self.E25L_center = Point(self.latE25L, self.lonE25L)
-        self.E25L_buffer = self.E25L_center.buffer(4/111.111)
-        
-        self.E25R_center = Point(self.latE25R, self.lonE25R)
-        self.E25R_buffer = self.E25R_center.buffer(4/111.111)
-
-        self.E07L_center = Point(self.latE07L, self.lonE07L)
-        self.E07L_buffer = self.E07L_center.buffer(4/111.111)
-
-        self.E07R_center = Point(self.latE07R, self.lonE07R)
-        self.E07R_buffer = self.E07R_center.buffer(4/111.111)
-
-        # Define Zone B boundary circle around WIII airport
-        stack.stack(f"CIRCLE ZONEB {self.latc} {self.lonc} {self.radius/nm}")
-        # Define Zone A boundary circle around WIII airport
-        stack.stack(f"CIRCLE ZONEA25L {self.lat25L} {self.lon25L} {0.4*self.radius/nm}")
-        stack.stack(f"CIRCLE ZONEA25R {self.lat25R} {self.lon25R} {0.4*self.radius/nm}")
-        stack.stack(f"CIRCLE ZONEA07L {self.lat07L} {self.lon07L} {0.4*self.radius/nm}")
-        stack.stack(f"CIRCLE ZONEA07R {self.lat07R} {self.lon07R} {0.4*self.radius/nm}")
-        # Define Zone C boundary circle around WIII airport
-        stack.stack(f"CIRCLE ZONEC {self.latc} {self.lonc} {1.5*self.radius/nm}")
-        # Define Zone D boundary circle around WIII airport
-        stack.stack(f"CIRCLE ZONED {self.latc} {self.lonc} {5*self.radius/nm}")
-        # Define the square effector exclusion zone around WIII airport
-        stack.stack(f"POLYALT SQUARE 0 122 -6.141335 106.607423 -6.08574 106.640835 -6.110221 106.705147 -6.165499 106.671481")
-        self.polycoords = ((-6.141335, 106.607423), (-6.08574, 106.640835), (-6.110221, 106.705147), (-6.165499, 106.671481))
-        self.polygon = Polygon(self.polycoords)
-        self.poly_center = centroid(self.polygon)
-        self.poly_buffer = self.poly_center.buffer(4/111.111)
-        # Define the colours of the Zones
-        stack.stack(f"COLOR ZONEB ORANGE")
-        stack.stack(f"COLOR ZONEA25L RED")
-        stack.stack(f"COLOR ZONEA25R RED")
-        stack.stack(f"COLOR ZONEA07L RED")
-        stack.stack(f"COLOR ZONEA07R RED")
-        stack.stack(f"COLOR ZONEC YELLOW")
-        stack.stack(f"COLOR ZONED GREEN")
-        stack.stack(f"COLOR SQUARE ORANGE")
+        # Stable aircraft numbers of the zone check schedule, shared with the other plugins
+        self.uids = stable_uids()
+        super().__init__()
+        # Engagement time needed by each effector type to neutralise a target [s]
+        self.durations = {'jammer': 20, 'gun': 5, 'laser': 10}
+        self.nneutralised = {weapon: 0 for weapon in self.durations}
+
+        # Per-aircraft dwell time inside the zones of each effector type [s]
+        with self.settrafarrays():
+            self.jammer_time = np.array([])
+            self.gun_time = np.array([])
+            self.laser_time = np.array([])
+            self.neutralised = np.array([], dtype=bool)
+
+        # Optional scheduling of the zone checks from the time to reach the nearest zone
+        self.schedule = False
+        self.scheduler = ZoneScheduler()
+
+        # Engage the sensor tracks instead of the true aircraft positions
+        self.tracks = False
+
+        # Default site: WIII with the effectors within the airport perimeter
+        self.site = None
+        ok, msg = self.set_site('WIII')
+        if not ok:
+            raise FileNotFoundError(msg)
 
         # Final config for ease of use
-        stack.stack(f"PAN WIII")
+        stack.stack(f"PAN {self.site.latc} {self.site.lonc}")
         stack.stack(f"VIS MAP TILEDMAP")
         stack.stack(f"ZOOM 3")
         stack.stack(f"ASAS ON")
         stack.stack("op")
 
-        self.gun_counter = 0
-        self.gun_duration = 5
-        self.refresh_duration = 0.05
-        self.max_gun_counter = self.gun_duration/self.refresh_duration
-
-        self.jammer_counter = 0
-        self.jammer_duration = 20
-        self.max_jammer_counter = self.jammer_duration/self.refresh_duration
-
-        self.laser_counter = 0
-        self.laser_duration = 10
-        self.max_laser_counter = self.laser_duration/self.refresh_duration
-
-        super().__init__()
-
-    # Checking if target is in Zone A for Runway 25L
-    @core.timed_function(name='check_circle_25L',dt=0.05)
-    def check_circle_25L(self):
-        inside_25L = []
-        inside_poly_25L = []
-
-        x = traf.lat
-        y = traf.lon
-
-        for i in range(len(x)):
-            x_local = x[i]
-            y_local = y[i]
-
-            coord = Point(x_local,y_local)
-
-            cond_circle = coord.within(self.E25L_buffer)
-
-            cond_polygon = coord.within(self.polygon)
-
-            cond = (cond_circle & ~cond_polygon)
-
-            inside_25L.append(cond_circle)
-
-            inside_poly_25L.append(cond_polygon)
-
-            weapon = 'jammer'
-
-            if(cond_circle):
-                if(weapon == "jammer"):
-                    stack.stack('ECHO {}/{}'.format(self.jammer_counter,self.max_jammer_counter))
-                    self.jammer_counter += 1
-                    if(self.jammer_counter >= self.max_jammer_counter):
-                        stack.stack('ALT {}, 0, -1000'.format(traf.id[i]))
-                        stack.stack('SPD {}, 0'.format(traf.id[i]))
-                        stack.stack('ECHO Target forced to land.')
-                        self.jammer_counter = 0
-                elif(weapon == "gun"):
-                    stack.stack('ECHO {}/{}'.format(self.gun_counter,self.max_gun_counter))
-                    self.gun_counter += 1
-                    if(self.gun_counter >= self.max_gun_counter):
-                        stack.stack('ECHO Target shot down.')
-                        stack.stack('DEL {}'.format(traf.id[i]))
-                        self.gun_counter = 0
-                elif(weapon == "laser"):
-                    stack.stack('ECHO {}/{}'.format(self.laser_counter,self.max_laser_counter))
-                    self.laser_counter += 1
-                    if(self.laser_counter >= self.max_laser_counter):
-                        stack.stack('ECHO Target shot down.')
-                        stack.stack('DEL {}'.format(traf.id[i]))
-                        self.laser_counter = 0
-
-    # Checking if target is in Zone A for Runway 25R
-    @core.timed_function(name='check_circle_25R',dt=0.05)
-    def check_circle_25R(self):
-        inside_25R = []
-        inside_poly_25R = []
-
-        x = traf.lat
-        y = traf.lon
-
-        for i in range(len(x)):
-            x_local = x[i]
-            y_local = y[i]
-
-            coord = Point(x_local,y_local)
-
-            cond_circle = coord.within(self.E25R_buffer)
-
-            cond_polygon = coord.within(self.polygon)
-
-            cond = (cond_circle & ~cond_polygon)
-
-            inside_25R.append(cond_circle)
-
-            inside_poly_25R.append(cond_polygon)
-
-            weapon = 'jammer'
-
-            if(cond_circle):
-                if(weapon == "jammer"):
-                    stack.stack('ECHO {}/{}'.format(self.jammer_counter,self.max_jammer_counter))
-                    self.jammer_counter += 1
-                    if(self.jammer_counter >= self.max_jammer_counter):
-                        stack.stack('ALT {}, 0, -1000'.format(traf.id[i]))
-                        stack.stack('SPD {}, 0'.format(traf.id[i]))
-                        stack.stack('ECHO Target forced to land.')
-                        self.jammer_counter = 0
-                elif(weapon == "gun"):
-                    stack.stack('ECHO {}/{}'.format(self.gun_counter,self.max_gun_counter))
-                    self.gun_counter += 1
-                    if(self.gun_counter >= self.max_gun_counter):
-                        stack.stack('ECHO Target shot down.')
-                        stack.stack('DEL {}'.format(traf.id[i]))
-                        self.gun_counter = 0
-                elif(weapon == "laser"):
-                    stack.stack('ECHO {}/{}'.format(self.laser_counter,self.max_laser_counter))
-                    self.laser_counter += 1
-                    if(self.laser_counter >= self.max_laser_counter):
-                        stack.stack('ECHO Target shot down.')
-                        stack.stack('DEL {}'.format(traf.id[i]))
-                        self.laser_counter = 0
-
-    # Checking if target is in Zone A for Runway 07L
-    @core.timed_function(name='check_circle_07L',dt=0.05)
-    def check_circle_07L(self):
-        inside_07L = []
-        inside_poly_07L = []
-
-        x = traf.lat
-        y = traf.lon
-
-        for i in range(len(x)):
-            x_local = x[i]
-            y_local = y[i]
-
-            coord = Point(x_local,y_local)
-
-            cond_circle = coord.within(self.E07L_buffer)
-
-            cond_polygon = coord.within(self.polygon)
-
-            cond = (cond_circle & ~cond_polygon)
-
-            inside_07L.append(cond_circle)
-
-            inside_poly_07L.append(cond_polygon)
-
-            weapon = 'jammer'
-
-            if(cond_circle):
-                if(weapon == "jammer"):
-                    stack.stack('ECHO {}/{}'.format(self.jammer_counter,self.max_jammer_counter))
-                    self.jammer_counter += 1
-                    if(self.jammer_counter >= self.max_jammer_counter):
-                        stack.stack('ALT {}, 0, -1000'.format(traf.id[i]))
-                        stack.stack('SPD {}, 0'.format(traf.id[i]))
-                        stack.stack('ECHO Target forced to land.')
-                        self.jammer_counter = 0
-                elif(weapon == "gun"):
-                    stack.stack('ECHO {}/{}'.format(self.gun_counter,self.max_gun_counter))
-                    self.gun_counter += 1
-                    if(self.gun_counter >= self.max_gun_counter):
-                        stack.stack('ECHO Target shot down.')
-                        stack.stack('DEL {}'.format(traf.id[i]))
-                        self.gun_counter = 0
-                elif(weapon == "laser"):
-                    stack.stack('ECHO {}/{}'.format(self.laser_counter,self.max_laser_counter))
-                    self.laser_counter += 1
-                    if(self.laser_counter >= self.max_laser_counter):
-                        stack.stack('ECHO Target shot down.')
-                        stack.stack('DEL {}'.format(traf.id[i]))
-                        self.laser_counter = 0
-
-    # Checking if target is in Zone A for Runway 07R
-    @core.timed_function(name='check_circle_07R',dt=0.05)
-    def check_circle_07R(self):
-        inside_07R = []
-        inside_poly_07R = []
-
-        x = traf.lat
-        y = traf.lon
-
-        for i in range(len(x)):
-            x_local = x[i]
-            y_local = y[i]
-
-            coord = Point(x_local,y_local)
-
-            cond_circle = coord.within(self.E07R_buffer)
-
-            cond_polygon = coord.within(self.polygon)
-
-            cond = (cond_circle & ~cond_polygon)
-
-            inside_07R.append(cond_circle)
-
-            inside_poly_07R.append(cond_polygon)
-
-            weapon = 'jammer'
-
-            if(cond_circle):
-                if(weapon == "jammer"):
-                    stack.stack('ECHO {}/{}'.format(self.jammer_counter,self.max_jammer_counter))
-                    self.jammer_counter += 1
-                    if(self.jammer_counter >= self.max_jammer_counter):
-                        stack.stack('ALT {}, 0, -1000'.format(traf.id[i]))
-                        stack.stack('SPD {}, 0'.format(traf.id[i]))
-                        stack.stack('ECHO Target forced to land.')
-                        self.jammer_counter = 0
-                elif(weapon == "gun"):
-                    stack.stack('ECHO {}/{}'.format(self.gun_counter,self.max_gun_counter))
-                    self.gun_counter += 1
-                    if(self.gun_counter >= self.max_gun_counter):
-                        stack.stack('ECHO Target shot down.')
-                        stack.stack('DEL {}'.format(traf.id[i]))
-                        self.gun_counter = 0
-                elif(weapon == "laser"):
-                    stack.stack('ECHO {}/{}'.format(self.laser_counter,self.max_laser_counter))
-                    self.laser_counter += 1
-                    if(self.laser_counter >= self.max_laser_counter):
-                        stack.stack('ECHO Target shot down.')
-                        stack.stack('DEL {}'.format(traf.id[i]))
-                        self.laser_counter = 0
+    def create(self, n=1):
+        ''' Create is called when new aircraft are created. '''
+        super().create(n)
+        self.jammer_time[-n:] = 0.0
+        self.gun_time[-n:] = 0.0
+        self.laser_time[-n:] = 0.0
+        self.neutralised[-n:] = False
+        # The tracks branch of check_zones does not use the schedule
+        if self.schedule and not self.tracks:
+            self.scheduler.add(self.uids.uid[-n:], sim.simt)
+
+    def reset(self):
+        ''' Reset the engagement state when simulation is reset. '''
+        super().reset()
+        self.nneutralised = {weapon: 0 for weapon in self.durations}
+        self.scheduler.reset()
+
+    @stack.command(name='OLSSITE')
+    def set_site(self, fname: str = ''):
+        ''' Load the airport zones and effector sites from a site file. '''
+        if not fname:
+            return True, f'OLS site is {self.site.name}'
+        try:
+            self.site = load_site(fname, os.path.join(settings.scenario_path, 'sites'))
+        except FileNotFoundError as e:
+            return False, str(e)
+
+        # Aircraft inside the zones of each effector type in the last check, last column is the exclusion polygon
+        self.inside = np.zeros((0, len(self.site.weapon_types) + 1), dtype=bool)
+        self.inside_poly = np.zeros(0, dtype=bool)
+        if self.schedule:
+            self.scheduler.reset(() if self.tracks else self.uids.uid, sim.simt)
+
+        # Draw the zones and the effector exclusion polygon
+        for cmd in self.site.zone_commands():
+            stack.stack(cmd)
+        return True, f'OLS site is set to {fname}'
+
+    @stack.command(name='OLSRASTER')
+    def set_raster(self, cellsize: float = None):
+        ''' Switch the coverage raster of the current site on with the given
+            cell size [m], or off with a cell size of zero. The raster is shared
+            with the sensors using the same site. '''
+        if cellsize is None:
+            return True, 'Coverage raster is ' + \
+                (f'ON ({self.site.grid.nx}x{self.site.grid.ny} cells)' if self.site.grid else 'OFF')
+        try:
+            self.site.set_raster(cellsize)
+        except ValueError as e:
+            return False, str(e)
+        return True, 'Coverage raster is ' + (f'ON with {cellsize} m cells' if cellsize else 'OFF')
+
+    @stack.command(name='OLSINDEX')
+    def set_index(self, flag: bool = None):
+        ''' Switch on/off the spatial index over all zones of all airports of the
+            current site. It is on by default for sites with more than one airport. '''
+        if flag is not None:
+            self.site.set_index(flag)
+        return True, 'OLS spatial index is ' + ('ON' if self.site.indexed else 'OFF')
+
+    @stack.command(name='OLSZONES')
+    def zones_of(self, acid: 'acid'):
+        ''' Show all zones of the current site that an aircraft is in. '''
+        inside = self.site.membership(traf.lat[[acid]], traf.lon[[acid]])[0]
+        names = [name for name, isin in zip(self.site.all_names, inside) if isin]
+        return True, f'{traf.id[acid]} is in ' + (', '.join(names) if names else 'no zone')
+
+    @stack.command(name='OLSSCHEDULE')
+    def set_schedule(self, flag: bool = None):
+        ''' Switch on/off the scheduling of zone checks: aircraft far from all
+            effector zones are only checked again when they could have reached one. '''
+        if flag is None:
+            return True, 'OLS zone check scheduling is ' + ('ON' if self.schedule else 'OFF')
+        self.schedule = flag
+        self.scheduler.reset(() if self.tracks else self.uids.uid, sim.simt)
+        return True, 'OLS zone check scheduling is ' + ('ON' if flag else 'OFF')
+
+    @stack.command(name='OLSTRACKS')
+    def set_tracks(self, flag: bool = None):
+        ''' Switch on/off engaging the sensor tracks instead of the true positions.
+            This needs the SensorDetection plugin with SENSORTRACK ON. '''
+        if flag is not None:
+            if flag and getattr(traf, 'sensors', None) is None:
+                return False, 'OLSTRACKS needs the SensorDetection plugin'
+            self.tracks = flag
+            # The schedule is not used while engaging tracks, it starts again from all aircraft after
+            self.scheduler.reset(() if flag else self.uids.uid, sim.simt)
+        return True, 'Engaging sensor tracks is ' + ('ON' if self.tracks else 'OFF')
+
+    # Checking if targets are in Zone A of any runway, all effectors in one pass
+    @core.timed_function(name='check_zones',dt=0.05)
+    def check_zones(self, dt):
+        if self.tracks:
+            # Zones are checked at the track positions, the effect is on the
+            # aircraft the track follows. Untracked aircraft are not engaged.
+            lat, lon, idx = traf.sensors.track_positions()
+            inside = self.site.effector_groups(lat[idx >= 0], lon[idx >= 0])
+            self.inside = np.zeros((traf.ntraf, len(self.site.weapon_types) + 1), dtype=bool)
+            rows, cols = np.nonzero(inside)
+            self.inside[idx[idx >= 0][rows], cols] = True
+        elif self.schedule:
+            # Only the aircraft that may have reached a zone are checked,
+            # all others are known to be outside of all zones
+            due = self.scheduler.pop_due(sim.simt, self.uids.uid)
+            lat, lon = traf.lat[due], traf.lon[due]
+            self.inside = np.zeros((traf.ntraf, len(self.site.weapon_types) + 1), dtype=bool)
+            self.inside[due] = self.site.effector_groups(lat, lon)
+            gap = self.site.effector_gap(lat, lon)
+            self.scheduler.reschedule(self.uids.uid[due], sim.simt, dt, gap, traf.gs[due])
+        else:
+            # The exclusion polygon mask is cached per tick in the site
+            self.inside = self.site.effector_groups(traf.lat, traf.lon, sim.simt)
+        self.inside_poly = self.inside[:, -1]
+
+        # Targets neutralised this tick, the effects are applied after all effectors are updated
+        done = {weapon: [] for weapon in self.durations}
+        for weapon, duration in self.durations.items():
+            dwell = getattr(self, weapon + '_time')
+            # Dwell advances while a target is inside any zone of this effector type,
+            # and starts again from zero when it leaves.
+            if weapon in self.site.weapon_types:
+                inzone = self.inside[:, self.site.weapon_types.index(weapon)] & ~self.neutralised
+            else:
+                inzone = np.zeros(traf.ntraf, dtype=bool)
+            dwell[:] = np.where(inzone, dwell + dt, 0.0)
+
+            done[weapon] = np.flatnonzero(dwell >= duration)
+            dwell[done[weapon]] = 0.0
+
+        self.neutralise(done)
+
+    def neutralise(self, done):
+        ''' Apply the effects of all engagements completed in this tick,
+            done maps each effector type to the aircraft indices it neutralised. '''
+        landed = done['jammer']
+        shot = np.union1d(done['gun'], done['laser']).astype(int)
+        if not (landed.size or shot.size):
+            return
+
+        for weapon, idx in done.items():
+            self.nneutralised[weapon] += len(idx)
+        self.neutralised[landed] = True
+        force_land(landed)
+        # Deleting shifts the aircraft indices, so this goes last
+        if shot.size:
+            shoot_down(shot)
+
+        stack.stack('ECHO {} target(s) forced to land, {} target(s) shot down.'.format(len(landed), len(shot)))
@@ -7,7 +7,7 @@ The headings are randomized, as are the spawn locations along the borders of the
 import numpy as np
 
 # Import the global bluesky objects. Uncomment the ones you need
-from bluesky import traf, sim  # , settings, navdb, traf, sim, scr, tools
+from bluesky import traf, sim, settings  # , navdb, traf, sim, scr, tools
 from bluesky.tools import datalog, areafilter
 from bluesky.core import Entity, timed_function
 from bluesky.tools.aero import ft, kts, nm, fpm
@@ -16,12 +16,56 @@ from bluesky import stack
 from bluesky import core
 from bluesky import traffic
 from bluesky import simulation
+from bluesky.plugins.callsigns import allocator
+import os
 import time
 import datetime
 
+# Spawn rings per (center, radius, heading range), shared by all runs with the same circle
+_rings = dict()
+
 def unix_to_datetime(unix_timestamp):
     return datetime.datetime.fromtimestamp(int(unix_timestamp))
 
+def destination(lat, lon, qdr, dist):
+    """ Great circle destination of arrays of start points (lat, lon in deg), bearings qdr [deg]
+    and distances dist [m], on the same local earth radius as qdrpos. """
+    lat1, lon1, qdr = np.radians(lat), np.radians(lon), np.radians(qdr)
+    delta = np.asarray(dist) / rwgs84(lat)
+    lat2 = np.arcsin(np.sin(lat1) * np.cos(delta) + np.cos(lat1) * np.sin(delta) * np.cos(qdr))
+    lon2 = lon1 + np.arctan2(
+        np.sin(qdr) * np.sin(delta) * np.cos(lat1), np.cos(delta) - np.sin(lat1) * np.sin(lat2)
+    )
+    return np.degrees(lat2), (np.degrees(lon2) + 180.0) % 360.0 - 180.0
+
+def set_destinations(idx, lat, lon):
+    """ Give the aircraft idx a destination waypoint at (lat, lon) [deg] and fly direct
+    to it, as the DEST command does, but on traf.ap.route without parsing stack commands.
+    After a conflict resolution the aircraft resume their route to the destination. """
+    for i, wlat, wlon in zip(np.asarray(idx).tolist(), np.asarray(lat).tolist(), np.asarray(lon).tolist()):
+        route = traf.ap.route[i]
+        name = f"{wlat},{wlon}"
+        traf.ap.dest[i] = name
+        iwp = route.addwpt(i, name, route.dest, wlat, wlon, 0.0, traf.cas[i])
+        # Only waypoint of the new route: activate it
+        traf.actwp.lat[i] = route.wplat[iwp]
+        traf.actwp.lon[i] = route.wplon[iwp]
+        traf.actwp.alt[i] = route.wpalt[iwp]
+        traf.actwp.spd[i] = route.wpspd[iwp]
+        traf.swlnav[i] = True
+        traf.swvnav[i] = True
+        route.iactwp = iwp
+        route.direct(i, route.wpname[iwp])
+
+def spawn_ring(latc, lonc, radius, heading_min, heading_max):
+    """ Bearings [deg] from the center and positions of the spawn points, one per degree. """
+    key = (latc, lonc, radius, heading_min, heading_max)
+    if key not in _rings:
+        bearings = np.arange(heading_min, heading_max, 1)
+        lat, lon = destination(np.full(len(bearings), float(latc)), float(lonc), bearings, radius)
+        _rings[key] = bearings, np.column_stack((lat, lon))
+    return _rings[key]
+
 def init_plugin():
 
     # Addtional initilisation code
@@ -39,7 +83,36 @@ def init_plugin():
 
 class CircleSpawner(Entity):
     def __init__(self):
+        super().__init__()
+        self.callsigns = allocator("D")  # shared unique callsign allocator
+        # Random stream of all spawn draws, seeded per run for reproducible experiments
+        self.seed = None
+        self.rng = np.random.default_rng(self.seed)
+        # Poisson arrival mode: arrival rate per sector of the spawn ring [aircraft/hour]
+        self.rates = None
+        self.blocksize = 1024  # number of arrivals sampled at once
+        self.arrival_times = np.zeros(0)  # pending arrival times [s]
+        self.arrival_ring = np.zeros(0, dtype=int)  # spawn ring index of each pending arrival
+        self.tlast = 0.0  # time of the last sampled arrival [s]
+        # Optional density heatmap over the experiment circle, instead of logging all positions
+        self.heatmap = False
+        self.cellsize = 0.0  # [m]
+        self.dumpinterval = 60.0  # time between two .npz dumps [s]
+        self.tdump = 0.0  # time of the next dump [s]
+        self.counts = np.zeros((0, 0))  # aircraft-seconds per cell
+        self.occupied = np.zeros((0, 0))  # seconds with at least one aircraft per cell
+        self.heatfile = ""
+        # Closed-loop control of the measured density mdens with a PI controller on the spawn rate
+        self.control = False
+        self.setpoint = 0.0  # target measured density [aircraft]
+        self.kp = 0.05  # proportional gain [1/s]
+        self.ki = 0.002  # integral gain [1/s2]
+        self.ratemax = 50.0  # maximum spawn rate [aircraft/s]
+        self.tinner = 0.0  # mean time a spawned aircraft spends in the measurement circle [s]
+        self.integral = 0.0  # integrated density error [aircraft s]
+        self.credit = 0.0  # fractional aircraft to spawn
         self.spawn_points2 = []
+        self.spawn_bearings = []  # bearing of each spawn point from the circle center [deg]
         height = 1000
         speed = 105
         heading = 100
@@ -59,7 +132,16 @@ class CircleSpawner(Entity):
         # )
         headerr = "density,latitude,longitude,id,time"
         self.loggedstuff = datalog.crelog("CircleSpawnLog", None, headerr)
-        super().__init__()
+
+    def reset(self):
+        super().reset()
+        self.callsigns.reset()
+        self.rng = np.random.default_rng(self.seed)
+        self.rates = None
+        self.clear_arrivals()
+        self.dump_heatmap()
+        self.heatmap = False
+        self.control = False
 
     @stack.command
     # Initialisation function - define circle position and area, as well as the desired density.
@@ -72,23 +154,11 @@ class CircleSpawner(Entity):
         heading_min: float,
         heading_max: float,
     ):
-        acid_gen = "EXP" + str(
-            int(np.round(np.random.rand(1) * 10000))
-        )  # random acid generate
-        self.spawn_points2 = np.array(
-            [
-                qdrpos(
-                    float(circle_center_lat),
-                    float(circle_center_lon),
-                    float(theta),
-                    float(radius / nm),
-                )
-                for theta in np.arange(heading_min, heading_max, 1)
-            ]
-        )
-        spawn_point = self.spawn_points2[
-            np.random.randint(0, np.size(self.spawn_points2) / 2)
-        ]
+        self.spawn_bearings, self.spawn_points2 = spawn_ring(
+            circle_center_lat, circle_center_lon, radius, heading_min, heading_max
+        )  # cached ring table, the same for every run with this circle
+        self.rng = np.random.default_rng(self.seed)  # same draws for every run with this seed
+        self.clear_arrivals()
         height = 1000
         speed = 105
         heading = 100
@@ -117,39 +187,293 @@ class CircleSpawner(Entity):
     @stack.command
     # Function to spawn drone/AC periodically - feeds into the timed function that follows and requires no inputs.
     def spawnsimple(self):
-        randint = np.random.randint(0, np.size(self.spawn_points2) / 2)
-        spawn_point = self.spawn_points2[randint]
-        acid_gen = "D" + str(
-            int(np.round(np.random.rand(1) * 100000))
-        )  # random acid generate
-        # heading_randcomp = 0 # to be edited!
+        self.spawn(1)
+        return
+
+    @stack.command
+    # Seed of the random stream of the spawner, used from the next SPAWNCIRCLE or reset on.
+    def spawnseed(self, seed: int):
+        self.seed = seed
+        return True, f"Spawn seed set to {seed}"
+
+    @stack.command
+    # Poisson arrival mode instead of keeping the density: arrival rate [aircraft/hour]
+    # per sector of the spawn ring, the ring being split in as many equal sectors as rates given.
+    # Without rates, the spawner goes back to keeping the density. Arrival mode switches off the
+    # density controller, so only one of them spawns.
+    def spawnrate(self, *rates: float):
+        self.clear_arrivals()
+        if not rates:
+            self.rates = None
+            return True, "Arrival mode OFF, spawning to keep the density"
+        self.rates = np.array(rates, dtype=float)
+        msg = "" if not self.control else ", density controller OFF"
+        self.control = False
+        return True, f"Arrival mode ON, {self.rates.sum():.0f} aircraft/hour over {len(rates)} sector(s)" + msg
+
+    def clear_arrivals(self):
+        self.arrival_times = np.zeros(0)
+        self.arrival_ring = np.zeros(0, dtype=int)
+        self.tlast = sim.simt
+
+    def sample_arrivals(self):
+        """ Sample the next block of arrivals of all sectors together: one Poisson
+        process at the total rate, each arrival going to a sector with probability
+        proportional to its rate, and to a random spawn point within that sector. """
+        total = self.rates.sum() / 3600.0  # [aircraft/s]
+        times = self.tlast + np.cumsum(self.rng.exponential(1.0 / total, self.blocksize))
+        self.tlast = times[-1]
+        ring = self.ring_sample(self.blocksize)
+        self.arrival_times = np.concatenate((self.arrival_times, times))
+        self.arrival_ring = np.concatenate((self.arrival_ring, ring))
+
+    @core.timed_function(name="arrivals")
+    # Poisson arrival mode: create all arrivals that are due in one go
+    def arrivals(self):
+        if self.control or self.rates is None or self.rates.sum() <= 0.0 or len(self.spawn_points2) == 0:
+            return
+        while self.tlast <= sim.simt:
+            self.sample_arrivals()
+        ndue = np.searchsorted(self.arrival_times, sim.simt, side="right")
+        if ndue:
+            self.spawn(ndue, self.arrival_ring[:ndue])
+            self.arrival_times = self.arrival_times[ndue:]
+            self.arrival_ring = self.arrival_ring[ndue:]
+        return
+
+    def spawn(self, n, randint=None):
+        """ Create n aircraft in one traf.cre call, at random points of the spawn ring,
+        or at the ring indices randint. """
+        if n <= 0 or len(self.spawn_points2) == 0:
+            return
+        self.cre_bulk(*self.draw(n, randint))
+        return
+
+    def draw(self, n, randint=None):
+        """ Draw n flights from the spawn ring: spawn position, heading [deg],
+        height [ft], speed [kts] and destination. Each aircraft heads for a random
+        destination on the far side of the circle, the destination basis point being
+        opposite of its spawn point. """
+        if randint is None:
+            randint = self.rng.integers(0, len(self.spawn_points2), n)
+        lat, lon = self.spawn_points2[randint].T
         heading = (
-            np.arange(0, 360, 3)[randint] - 180.0
-        )  # set heading into the center of the circle, and add distribution component!
-        height = 1000 * np.random.rand(1)[0]
-        speed = (
-            150.0 * np.random.rand(1)[0]
-        )  # same distribution considerations needed for the speed and height! [TODO!!]
-        stack.stack(
-            f"CRE {acid_gen}, C172, {spawn_point[0]} {spawn_point[1]} {heading} {height} {speed}"
-        )
-        dest_center = kwikpos(
-            self.latc, self.lonc, heading, 2.5 * self.radius / nm
+            self.spawn_bearings[randint] - 180.0
+        )  # heading into the center of the circle, from the ring bearing of the spawn point
+        height = 1000 * self.rng.random(n)  # [ft]
+        speed = 150.0 * self.rng.random(n)  # [kts]
+        dest_center = destination(
+            np.full(n, float(self.latc)), float(self.lonc), heading, 2.5 * self.radius
         )  # basis point for random destination select
-        lat_dest, lon_dest = kwikpos(
+        lat_dest, lon_dest = destination(
             dest_center[0],
             dest_center[1],
-            heading + 90 * (np.random.rand(1) * 2 - 1),
-            0.2 * self.radius * np.random.rand(1) / nm,
+            heading + 90 * (self.rng.random(n) * 2 - 1),
+            0.2 * self.radius * self.rng.random(n),
         )
-        stack.stack(f"{acid_gen} dest {float(lat_dest)},{float(lon_dest)}")
+        # Aircraft start on the heading towards their destination
+        hdg_dest, _ = kwikqdrdist(lat, lon, lat_dest, lon_dest)
+        return lat, lon, hdg_dest % 360.0, height, speed, lat_dest, lon_dest
+
+    def cre_bulk(self, lat, lon, hdg, height, speed, lat_dest, lon_dest):
+        """ Create all given aircraft in one traf.cre call, height in ft and speed in kts,
+        and give each its destination. """
+        n = len(lat)
+        if n == 0:
+            return
+        nums = self.callsigns.allocate(n)  # unique acids, no failed CRE on existing ids
+        traf.cre(self.callsigns.callsigns(nums), "C172", lat, lon, hdg, height * ft, speed * kts)
+        set_destinations(np.arange(traf.ntraf - n, traf.ntraf), lat_dest, lon_dest)
         return
 
+    @stack.command
+    # Warm start: create n aircraft (default: the prescribed density, or the expected number in
+    # arrival mode) as the steady-state population, so measurements need no fill-up phase.
+    def spawnwarm(self, n: int = None):
+        if len(self.spawn_points2) == 0:
+            return False, "SPAWNWARM needs a SPAWNCIRCLE first"
+        if n is None:
+            n = self.steady_count()
+        if n <= 0:
+            # Nothing to sample, also when a low arrival rate rounds down to no aircraft
+            return True, "Warm start with 0 aircraft"
+        self.cre_bulk(*self.steady_state(n))
+        return True, f"Warm start with {n} aircraft"
+
+    def residence(self, lat, lon, hdg, speed, frac=1.0):
+        """ Chord length [m] of the straight tracks from the spawn points through the
+        circle of frac times the radius, and the time [s] spent in it; for frac = 1 this
+        is the time before the deletion area is left. """
+        bearing, _ = kwikqdrdist(self.latc, self.lonc, lat, lon)
+        # angle between the track and the inward radial of the spawn point
+        alpha = np.radians(hdg - bearing - 180.0)
+        # closest distance of the track to the circle center
+        dmin = self.radius * np.abs(np.sin(alpha))
+        chord = np.where(
+            np.cos(alpha) > 0.0,
+            2.0 * np.sqrt(np.maximum((frac * self.radius) ** 2 - dmin**2, 0.0)),
+            0.0,
+        )
+        # very slow drones would stay forever, floor at 1 kts
+        return chord, chord / (np.maximum(speed, 1.0) * kts)
+
+    def steady_count(self):
+        """ Expected number of aircraft in the circle: the density in density mode, or
+        the arrival rate times the mean residence time in arrival mode (Little's law). """
+        if self.rates is None:
+            return int(np.ceil(self.density))
+        lat, lon, hdg, _, speed, _, _ = self.draw(self.blocksize, self.ring_sample(self.blocksize))
+        _, tres = self.residence(lat, lon, hdg, speed)
+        return int(np.round(self.rates.sum() / 3600.0 * tres.mean()))
+
+    def ring_sample(self, n):
+        """ Spawn ring indices of n flights, drawn per sector in arrival mode. """
+        if self.rates is None:
+            return self.rng.integers(0, len(self.spawn_points2), n)
+        sector = self.rng.choice(len(self.rates), n, p=self.rates / self.rates.sum())
+        bounds = (np.arange(len(self.rates) + 1) * len(self.spawn_points2)) // len(self.rates)
+        return bounds[sector] + (self.rng.random(n) * (bounds[sector + 1] - bounds[sector])).astype(int)
+
+    def steady_state(self, n):
+        """ Sample n aircraft of the steady-state population. Flights are drawn as for
+        spawning and accepted with a probability proportional to the time they spend
+        in the circle (chord length over speed); each accepted aircraft is placed
+        uniformly along its track through the circle. """
+        flights = [[] for _ in range(7)]
+        nacc = 0
+        wmax = 2.0 * self.radius / kts  # residence time of a full diameter at 1 kts
+        while nacc < n:
+            lat, lon, hdg, height, speed, lat_dest, lon_dest = self.draw(4 * n, self.ring_sample(4 * n))
+            chord, tres = self.residence(lat, lon, hdg, speed)
+            acc = self.rng.random(4 * n) * wmax < tres
+            for col, val in zip(flights, (lat, lon, hdg, height, speed, lat_dest, lon_dest)):
+                col.append(val[acc])
+            # place the aircraft along their chord
+            frac = self.rng.random(np.count_nonzero(acc))
+            flights[0][-1], flights[1][-1] = destination(
+                lat[acc], lon[acc], hdg[acc], frac * chord[acc]
+            )
+            nacc += np.count_nonzero(acc)
+        return [np.concatenate(col)[:n] for col in flights]
+
+    @stack.command
+    # Density heatmap over the experiment circle with the given cell size [m], dumped as .npz
+    # every dumpinterval seconds; the text log then only gets the measured density.
+    # A cell size of zero switches the heatmap off.
+    def spawnheatmap(self, cellsize: float = None, dumpinterval: float = 60.0):
+        if cellsize is None:
+            return True, "Density heatmap is " + (
+                f"ON ({self.counts.shape[1]}x{self.counts.shape[0]} cells of {self.cellsize} m)"
+                if self.heatmap else "OFF"
+            )
+        if cellsize <= 0.0:
+            self.dump_heatmap()
+            self.heatmap = False
+            return True, "Density heatmap is OFF"
+        if self.radius <= 0.0:
+            return False, "SPAWNHEATMAP needs a SPAWNCIRCLE first"
+        self.heatmap = True
+        self.cellsize = cellsize
+        self.dumpinterval = dumpinterval
+        self.tdump = sim.simt + dumpinterval
+        ncells = int(np.ceil(2.0 * self.radius / cellsize))
+        self.counts = np.zeros((ncells, ncells))
+        self.occupied = np.zeros((ncells, ncells))
+        self.heatfile = os.path.join(
+            settings.log_path,
+            f"CircleSpawnHeatmap_{datetime.datetime.now().strftime('%Y%m%d_%H-%M-%S')}.npz",
+        )
+        return True, f"Density heatmap is ON ({ncells}x{ncells} cells), dumped to {self.heatfile}"
+
+    def update_heatmap(self, dt):
+        """ Add dt seconds of the current traffic to the heatmap: cells of a square grid
+        over the experiment circle, in a flat east-north frame around the circle center. """
+        ny, nx = self.counts.shape
+        x = (traf.lon - self.lonc) * np.cos(np.radians(self.latc)) * 60.0 * nm + self.radius
+        y = (traf.lat - self.latc) * 60.0 * nm + self.radius
+        col = np.floor(x / self.cellsize).astype(int)
+        row = np.floor(y / self.cellsize).astype(int)
+        ingrid = (col >= 0) & (col < nx) & (row >= 0) & (row < ny)
+        counts = np.bincount(row[ingrid] * nx + col[ingrid], minlength=nx * ny).reshape(ny, nx)
+        self.counts += dt * counts
+        self.occupied += dt * (counts > 0)
+        if sim.simt >= self.tdump:
+            self.dump_heatmap()
+            self.tdump += self.dumpinterval
+
+    def dump_heatmap(self):
+        """ Write the heatmap accumulated so far, the file is overwritten on every dump. """
+        if not self.heatmap:
+            return
+        np.savez_compressed(
+            self.heatfile,
+            counts=self.counts,
+            occupied=self.occupied,
+            cellsize=self.cellsize,
+            center=np.array([self.latc, self.lonc]),
+            radius=self.radius,
+            simt=sim.simt,
+        )
+
+    @stack.command
+    # Closed-loop mode: spawn rate set by a PI controller to hold the measured density mdens in
+    # the measurement circle at the setpoint. The setpoint can be changed during a run, a setpoint
+    # of zero switches the controller off. Optional gains kp [1/s] and ki [1/s2]. The controller
+    # switches off the arrival mode, so only one of them spawns.
+    def spawncontrol(self, setpoint: float = None, kp: float = None, ki: float = None):
+        if setpoint is None:
+            return True, "Density controller is " + (
+                f"ON (setpoint {self.setpoint}, measured {self.mdens})" if self.control else "OFF"
+            )
+        if kp is not None:
+            self.kp = kp
+        if ki is not None:
+            self.ki = ki
+        if setpoint <= 0.0:
+            self.control = False
+            return True, "Density controller is OFF"
+        if len(self.spawn_points2) == 0:
+            return False, "SPAWNCONTROL needs a SPAWNCIRCLE first"
+        msg = ", arrival mode OFF" if self.rates is not None else ""
+        self.rates = None
+        self.clear_arrivals()
+        if not self.control:
+            self.integral = 0.0
+            self.credit = 0.0
+            # Feedforward: the spawn rate that holds the setpoint in steady state is the
+            # setpoint over the mean time a spawned aircraft spends in the measurement circle
+            lat, lon, hdg, _, speed, _, _ = self.draw(self.blocksize)
+            self.tinner = self.residence(lat, lon, hdg, speed, 0.45)[1].mean()
+        self.control = True
+        self.setpoint = setpoint
+        return True, f"Density controller ON, setpoint {setpoint}" + msg
+
+    def control_rate(self, dt):
+        """ Spawn rate [aircraft/s] from the feedforward and the PI terms. The error is
+        only integrated while the rate is not saturated, or when it drives the rate
+        back from saturation (anti-windup). """
+        error = self.setpoint - self.mdens
+        feedforward = self.setpoint / max(self.tinner, 1.0)
+        rate = feedforward + self.kp * error + self.ki * (self.integral + error * dt)
+        if 0.0 <= rate <= self.ratemax or (rate > self.ratemax) == (error < 0.0):
+            self.integral += error * dt
+        return np.clip(feedforward + self.kp * error + self.ki * self.integral, 0.0, self.ratemax)
+
     @core.timed_function(name="cdenskeep", dt=0.5)
-    # spawn aircraft continuously to keep density at prescribed value
-    def genac(self):
-        if np.size(traf.id) < self.density:
-            stack.stack(f"SPAWNSIMPLE")
+    # spawn aircraft continuously to keep density at prescribed value, all missing aircraft at once
+    def genac(self, dt=0.5):
+        if self.control:
+            # controller mode: the spawn credit accumulates, whole aircraft are spawned in one batch
+            self.credit += self.control_rate(dt) * dt
+            n = int(self.credit)
+            self.credit -= n
+            self.spawn(n)
+            return
+        if self.rates is not None:
+            return  # arrival mode
+        deficit = int(np.ceil(self.density - traf.ntraf))
+        if deficit > 0:
+            self.spawn(deficit)
         return
 
     @core.timed_function(name="statcomp", dt=1.0)
@@ -166,6 +490,13 @@ class CircleSpawner(Entity):
         self.mdens = np.shape(dist2center[ind2keep])[
             0
         ]  # just length of center dist vec where drones are in measurement circle
+        if self.heatmap:
+            # positions go into the heatmap, the text log only gets the density
+            self.update_heatmap(1.0)
+            self.loggedstuff.log(
+                self.mdens, "", "", "", unix_to_datetime(sim.simt + self.standardtime)
+            )
+            return
         self.lat_cc, self.lon_cc = (
             traf.lat[ind2keep],
             traf.lon[ind2keep],
@@ -1,22 +1,26 @@
 # Plugin to simulate sensor (i.e. radar) detection upon entering a certain circular area
-# From XXXX to DROXXXX
+# Detected aircraft are flagged, and are optionally announced in an ECHO under an alias (XXXX to DROXXXX)
+# The sensor sites are read from the same site files as AirportOLS (scenario/sites).
+# Use SENSORSITE WIII_outside for the sensors outside of the WIII airport perimeter.
+# With SENSORMODEL ON detection is probabilistic, and only done once per scan period.
+# With SENSORSECTOR ON the sensors are rotating radars, which only see the sector swept in each tick.
+# With SENSORTRACK ON the radar plots are fused into tracks, which AirportOLS can engage (OLSTRACKS).
 # Written by FreezingFalcon
 
-from bluesky import core, traf, stack, sim, tools
-from bluesky.tools import datalog, areafilter
-from bluesky.tools.geo import *
-from shapely import *
+from bluesky import core, traf, stack, sim, settings
+from bluesky.plugins.olszones import load_site, ZoneScheduler
+from bluesky.plugins.olstracker import Tracker
+from bluesky.plugins.stableuid import stable_uids
+from bluesky.plugins.callsigns import uid_indices
 
+import os
 import numpy as np
-import time
-import datetime
-
-def unix_to_datetime(unix_timestamp):
-    return datetime.datetime.fromtimestamp(int(unix_timestamp))
 
 def init_plugin():
 
     SDet = SensorDetection()
+    # The effectors of AirportOLS can engage the tracks of the sensors
+    traf.sensors = SDet
 
     # Configuration parameters
     config = {
@@ -31,134 +35,259 @@ def init_plugin():
 
 class SensorDetection(core.Entity):
     def __init__(self):
-        self.radius = 10000
-        self.latc = -6.1264
-        self.lonc = 106.6547
-        self.latE25L = -6.127992
-        self.lonE25L = 106.685071
-        self.latE25R = -6.099304
-        self.lonE25R = 106.677291
-        self.latE07L = -6.116856
-        self.lonE07L = 106.634743
-        self.latE07R = -6.148298
-        self.lonE07R = 106.633058
-        self.density = 1000
-        self.mdens = 0
-        self.lat_cc, self.lon_cc = 0, 0
-        self.standardtime = time.time()
-        headerr = "density,latitude,longitude,id,time"
-        self.loggedstuff = datalog.crelog("CircleSpawnLog", None, headerr)
-        
-        # Create points within the airport to position the effectors (within airport perimeters)
-        self.E25L_center = Point(self.latE25L, self.lonE25L)
-        self.E25L_buffer = self.E25L_center.buffer(4.8/111.111)
-        
-        self.E25R_center = Point(self.latE25R, self.lonE25R)
-        self.E25R_buffer = self.E25R_center.buffer(4.8/111.111)
-
-        self.E07L_center = Point(self.latE07L, self.lonE07L)
-        self.E07L_buffer = self.E07L_center.buffer(4.8/111.111)
-
-        self.E07R_center = Point(self.latE07R, self.lonE07R)
-        self.E07R_buffer = self.E07R_center.buffer(4.8/111.111)
-
-        # Define Max Detection Range boundary circle around WIII airport
-        stack.stack(f"CIRCLE DETECT25L {self.latE25L} {self.lonE25L} {0.48*self.radius/nm}")
-        stack.stack(f"CIRCLE DETECT25R {self.latE25R} {self.lonE25R} {0.48*self.radius/nm}")
-        stack.stack(f"CIRCLE DETECT07L {self.latE07L} {self.lonE07L} {0.48*self.radius/nm}")
-        stack.stack(f"CIRCLE DETECT07R {self.latE07R} {self.lonE07R} {0.48*self.radius/nm}")
-
-        # Define the colours of the Zones
-        stack.stack(f"COLOR DETECT25L BLACK")
-        stack.stack(f"COLOR DETECT25R BLACK")
-        stack.stack(f"COLOR DETECT07L BLACK")
-        stack.stack(f"COLOR DETECT07R BLACK")
+        # Stable aircraft numbers of the schedule and the track labels, shared with the other plugins
+        self.uids = stable_uids()
+        super().__init__()
+        with self.settrafarrays():
+            self.detected = np.array([], dtype=bool)    # Detected by any sensor
+            self.tdetect = np.array([])                 # Sim time of first detection [s]
+            self.tinrange = np.array([])                # Sim time of first time in sensor range [s]
+            self.tplot = np.array([])                   # Sim time of the last radar plot [s]
+            self.alias = []                             # ECHO alias, XXXX to DROXXXX
+
+        # Announce detected aircraft in an ECHO under their alias. The alias is not
+        # shown on the radar screen, and the aircraft id is never changed.
+        self.relabel = False
+
+        # Probabilistic sensor model of the site, evaluated at the scan epochs only
+        self.model = False
+        self.seed = 0
+        self.rng = np.random.default_rng(self.seed)
+        self.tscan = 0.0
+        self.latencies = []     # Time from coming in range to detection [s]
+
+        # Rotating radar mode: plots of the targets painted by the antenna beams
+        self.sector = False
+        self.tsweep = 0.0
+        self.plots = []         # Per tick: (time, sensor, uid, lat, lon) arrays
+        self.plotage = 10.0     # Plots not collected within this time [s] are dropped
+
+        # Multi-sensor tracker fed with the radar plots, in the local frame of the site
+        self.track = False
+        self.tracker = Tracker()
+
+        # Optional scheduling of the range checks from the time to reach the nearest sensor range
+        self.schedule = False
+        self.scheduler = ZoneScheduler()
+
+        # Default site: WIII with the sensors within the airport perimeter
+        self.site = None
+        ok, msg = self.set_site('WIII')
+        if not ok:
+            raise FileNotFoundError(msg)
 
         # Final config for ease of use
-        stack.stack(f"PAN WIII")
+        stack.stack(f"PAN {self.site.latc} {self.site.lonc}")
         stack.stack(f"VIS MAP TILEDMAP")
         stack.stack(f"ZOOM 3")
         stack.stack(f"ASAS ON")
         stack.stack("op")
 
-        super().__init__()
-
-    @core.timed_function(name='InRangeChange_25L',dt=0.05)
-    def InRangeChange_25L(self):
-        inside_sensor_25L = []
-
-        x = traf.lat
-        y = traf.lon
-
-        for i in range(len(x)):
-            x_local = x[i]
-            y_local = y[i]
-
-            coord = Point(x_local, y_local)
-
-            cond = coord.within(self.E25L_buffer)
-
-            inside_sensor_25L.append(cond)
-
-            if(cond):
-                traf.id[i] = traf.id[i].replace("XXX","DRO")
-
-    @core.timed_function(name='InRangeChange_25R',dt=0.05)
-    def InRangeChange_25R(self):
-        inside_sensor_25R = []
-
-        x = traf.lat
-        y = traf.lon
-
-        for i in range(len(x)):
-            x_local = x[i]
-            y_local = y[i]
-
-            coord = Point(x_local, y_local)
-
-            cond = coord.within(self.E25R_buffer)
-
-            inside_sensor_25R.append(cond)
-
-            if(cond):
-                traf.id[i] = traf.id[i].replace("XXX","DRO")
-
-    @core.timed_function(name='InRangeChange_07L',dt=0.05)
-    def InRangeChange_07L(self):
-        inside_sensor_07L = []
-
-        x = traf.lat
-        y = traf.lon
-
-        for i in range(len(x)):
-            x_local = x[i]
-            y_local = y[i]
-
-            coord = Point(x_local, y_local)
-
-            cond = coord.within(self.E07L_buffer)
-
-            inside_sensor_07L.append(cond)
-
-            if(cond):
-                traf.id[i] = traf.id[i].replace("XXX","DRO")
-
-    @core.timed_function(name='InRangeChange_07R',dt=0.05)
-    def InRangeChange_07R(self):
-        inside_sensor_07R = []
-
-        x = traf.lat
-        y = traf.lon
-
-        for i in range(len(x)):
-            x_local = x[i]
-            y_local = y[i]
-
-            coord = Point(x_local, y_local)
-
-            cond = coord.within(self.E07R_buffer)
-
-            inside_sensor_07R.append(cond)
-
-            if(cond):
-                traf.id[i] = traf.id[i].replace("XXX","DRO")
\ No newline at end of file
+    def create(self, n=1):
+        ''' Create is called when new aircraft are created. '''
+        super().create(n)
+        self.detected[-n:] = False
+        self.tdetect[-n:] = np.nan
+        self.tinrange[-n:] = np.nan
+        self.tplot[-n:] = np.nan
+        if self.schedule:
+            self.scheduler.add(self.uids.uid[-n:], sim.simt)
+
+    def reset(self):
+        ''' Reset the schedule when simulation is reset. '''
+        super().reset()
+        self.scheduler.reset()
+        self.rng = np.random.default_rng(self.seed)
+        self.tscan = 0.0
+        self.latencies = []
+        self.tsweep = 0.0
+        self.plots = []
+        self.tracker.reset()
+
+    @stack.command(name='SENSORSITE')
+    def set_site(self, fname: str = ''):
+        ''' Load the sensor sites from a site file. '''
+        if not fname:
+            return True, f'Sensor site is {self.site.name}'
+        try:
+            self.site = load_site(fname, os.path.join(settings.scenario_path, 'sites'))
+        except FileNotFoundError as e:
+            return False, str(e)
+        # Tracks are kept in the frame of the site
+        self.tracker.reset()
+        self.tracker.r = self.site.sensor_model.sigma
+        if self.schedule:
+            self.scheduler.reset(self.uids.uid[~self.detected], sim.simt)
+
+        # Define Max Detection Range boundary circle of each sensor
+        for cmd in self.site.sensor_commands():
+            stack.stack(cmd)
+        return True, f'Sensor site is set to {fname}'
+
+    @stack.command(name='SENSORSCHEDULE')
+    def set_schedule(self, flag: bool = None):
+        ''' Switch on/off the scheduling of range checks: aircraft far from all
+            sensors are only checked again when they could have come in range. '''
+        if flag is None:
+            return True, 'Sensor range check scheduling is ' + ('ON' if self.schedule else 'OFF')
+        self.schedule = flag
+        self.scheduler.reset(self.uids.uid[~self.detected], sim.simt)
+        return True, 'Sensor range check scheduling is ' + ('ON' if flag else 'OFF')
+
+    @stack.command(name='SENSORALIAS')
+    def set_relabel(self, flag: bool = None):
+        ''' Switch on/off echoing newly detected aircraft under their alias
+            (XXXX to DROXXXX). The alias only appears in the ECHO, not on the radar screen. '''
+        if flag is not None:
+            self.relabel = flag
+        return True, 'Sensor detection ECHO alias is ' + ('ON' if self.relabel else 'OFF')
+
+    @stack.command(name='SENSORMODEL')
+    def set_model(self, flag: bool = None, period: float = None, seed: int = None):
+        ''' Switch on/off the probabilistic sensor model of the site, optionally
+            with its scan period [s] and the seed of the random generator. '''
+        if flag is not None:
+            self.model = flag
+            self.tscan = sim.simt
+        if period is not None:
+            self.site.sensor_model.period = period
+        if seed is not None:
+            self.seed = seed
+            self.rng = np.random.default_rng(seed)
+        return True, 'Sensor model is ' + \
+            (f'ON (scan period {self.site.sensor_model.period} s, seed {self.seed})' if self.model else 'OFF')
+
+    @stack.command(name='SENSORSTATS')
+    def stats(self):
+        ''' Show the detection latency: the time from coming in range to detection. '''
+        if not self.latencies:
+            return True, 'No aircraft detected yet'
+        lat = np.array(self.latencies)
+        return True, f'{len(lat)} detected, latency mean {lat.mean():.1f} s, ' + \
+            f'median {np.median(lat):.1f} s, 95% {np.percentile(lat, 95):.1f} s, max {lat.max():.1f} s'
+
+    @stack.command(name='SENSORSECTOR')
+    def set_sector(self, flag: bool = None):
+        ''' Switch on/off the rotating radar mode, in which each sensor only
+            sees the targets in the sector its antenna swept in the last tick. '''
+        if flag is not None:
+            self.sector = flag
+            self.tsweep = sim.simt
+            self.plots = []
+        return True, 'Rotating radar mode is ' + ('ON' if self.sector else 'OFF')
+
+    @stack.command(name='SENSORTRACK')
+    def set_track(self, flag: bool = None):
+        ''' Switch on/off the tracker, which fuses the plots of all sensors into
+            tracks. This also switches on the rotating radar mode. '''
+        if flag is not None:
+            self.track = flag
+            self.tracker.reset()
+            if flag and not self.sector:
+                self.set_sector(True)
+        msg = f'Sensor tracking is ON ({sum(self.tracker.confirmed)} confirmed tracks)' \
+            if self.track else 'Sensor tracking is OFF'
+        return True, msg
+
+    def track_positions(self):
+        ''' Positions of the confirmed tracks at the current sim time, with the
+            index of the aircraft each track follows (-1 when it was deleted). '''
+        x, y, label, _ = self.tracker.positions(sim.simt)
+        lat, lon = self.site.frame.unproject(x, y)
+        idx, found = uid_indices(self.uids.uid, label)
+        return lat, lon, np.where(found, idx, -1)
+
+    def pop_plots(self):
+        ''' Return all radar plots since the last call, sorted by time, as arrays
+            of plot time [s], sensor index, aircraft uid, latitude and longitude. '''
+        plots = [np.concatenate(col) for col in zip(*self.plots)] if self.plots else \
+            [np.zeros(0), np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0), np.zeros(0)]
+        self.plots = []
+        order = np.argsort(plots[0], kind='stable')
+        return [col[order] for col in plots]
+
+    # Checking if undetected targets are in range of any sensor, all sensors in one pass
+    @core.timed_function(name='InRangeChange',dt=0.05)
+    def InRangeChange(self, dt):
+        if self.sector:
+            self.sweep()
+            if self.track:
+                tplot, _, uid, lat, lon = self.pop_plots()
+                self.tracker.update(tplot, *self.site.frame.project(lat, lon), uid)
+                self.tracker.prune(sim.simt)
+            return
+
+        if self.model:
+            # The sensors only look at the scan epochs
+            if sim.simt < self.tscan - 1e-6:
+                return
+            dt = self.site.sensor_model.period
+            self.tscan += dt * np.floor((sim.simt - self.tscan) / dt + 1.0)
+
+        if self.schedule:
+            # Only the aircraft that may have come in range are checked,
+            # detected aircraft are not scheduled again
+            due = self.scheduler.pop_due(sim.simt, self.uids.uid)
+        else:
+            due = np.flatnonzero(~self.detected)
+        lat, lon = traf.lat[due], traf.lon[due]
+        if self.model:
+            dist = self.site.sensor_ranges(lat, lon)
+            inrange = (dist < self.site.sensradius).any(axis=1)
+            hit = self.site.sensor_model.detect(dist, self.site.sensradius, traf.alt[due], self.rng)
+        else:
+            inrange = hit = self.site.sensor_coverage(lat, lon)
+        first = due[inrange][np.isnan(self.tinrange[due[inrange]])]
+        self.tinrange[first] = sim.simt
+
+        if self.schedule:
+            # Aircraft in range that were missed are due again in the next scan
+            gap = self.site.sensor_gap(lat[~hit], lon[~hit])
+            self.scheduler.reschedule(self.uids.uid[due[~hit]], sim.simt, dt, gap, traf.gs[due[~hit]])
+
+        new = due[hit]
+        if new.size:
+            self.detect(new)
+
+    def sweep(self):
+        ''' Rotating radar mode: the bearings of all aircraft from all sensors are
+            computed in one pass, and only the aircraft in the sector swept since
+            the last tick are plotted. All painted aircraft get a plot, also the
+            aircraft that were already detected, so they can be tracked. '''
+        t0, self.tsweep = self.tsweep, sim.simt
+        if self.tsweep <= t0 or traf.ntraf == 0:
+            return
+        iac, isens, tplot, dist = self.site.sensor_sweep(traf.lat, traf.lon, t0, self.tsweep)
+        inrange = np.flatnonzero((dist < self.site.sensradius).any(axis=1) & np.isnan(self.tinrange))
+        self.tinrange[inrange] = sim.simt
+
+        if self.model:
+            pd = self.site.sensor_model.pd(dist[iac, isens][:, np.newaxis],
+                                           self.site.sensradius[isens][:, np.newaxis], traf.alt[iac])
+            hit = self.rng.random(len(iac)) < pd[:, 0]
+            iac, isens, tplot = iac[hit], isens[hit], tplot[hit]
+        if iac.size == 0:
+            return
+
+        np.fmax.at(self.tplot, iac, tplot)
+        # Plot positions have the measurement error of the sensors
+        err = self.rng.normal(0.0, self.site.sensor_model.sigma, (2, len(iac)))
+        lat = traf.lat[iac] + err[1] / self.site.frame.kn
+        lon = traf.lon[iac] + err[0] / self.site.frame.ke
+        self.plots.append((tplot, isens, self.uids.uid[iac], lat, lon))
+        while self.plots and self.plots[0][0].max() < sim.simt - self.plotage:
+            self.plots.pop(0)
+
+        new = np.unique(iac[~self.detected[iac]])
+        if new.size:
+            self.detect(new)
+
+    def detect(self, idx):
+        ''' Register the first detection of the aircraft in idx. '''
+        self.detected[idx] = True
+        self.tdetect[idx] = sim.simt
+        self.latencies.extend((self.tdetect[idx] - self.tinrange[idx]).tolist())
+        if self.relabel:
+            for i in idx:
+                self.alias[i] = traf.id[i].replace("XXX","DRO")
+            stack.stack('ECHO Detected: ' + ' '.join(self.alias[i] for i in idx))
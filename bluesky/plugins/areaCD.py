@@ -0,0 +1,98 @@
+# Conflict detection restricted to the experiment areas of AreaDel
+
+import numpy as np
+from bluesky import stack, traf  #, settings, navdb, sim, scr, tools
+from bluesky.tools.aero import nm
+from bluesky.traffic.asas.statebased import StateBased
+
+# Buffer around the areas [nm], None for the lookahead based default
+buffer = None
+
+def init_plugin():
+    config = {
+        # The name of your plugin
+        'plugin_name':     'areaCD',
+
+        # The type of this plugin.
+        'plugin_type':     'sim'
+        }
+    return config
+
+@stack.command
+def cdarea(flag: bool = None, buf: float = None):
+    ''' CDAREA ON/OFF [buffer nm]: Conflict detection only near the experiment area '''
+    global buffer
+    if flag is None:
+        return True, f'CDAREA is {"ON" if isinstance(traf.cd, AreaStateBased) else "OFF"}, ' + \
+            (f'buffer {buffer} nm' if buffer is not None else 'lookahead buffer')
+    if not flag:
+        StateBased.select()
+        return True, 'CDAREA is OFF, conflict detection for all aircraft'
+    if not hasattr(traf, 'areadel'):
+        return False, 'CDAREA needs the AREADEL plugin'
+    buffer = buf
+    AreaStateBased.select()
+    return True, 'CDAREA is ON, ' + (f'buffer {buffer} nm' if buffer is not None else 'lookahead buffer')
+
+class Subset:
+    ''' The traffic arrays of a subset of the aircraft, read by the detection
+        method as if they were the whole traffic. '''
+    def __init__(self, traffic, idx):
+        self.traffic = traffic
+        self.idx = idx
+        self.ntraf = len(idx)
+        self.id = [traffic.id[i] for i in idx]
+
+    def __getattr__(self, name):
+        # Only called for arrays not taken yet
+        value = np.asarray(getattr(self.traffic, name))[self.idx]
+        setattr(self, name, value)
+        return value
+
+class AreaStateBased(StateBased):
+    ''' State-based conflict detection of the aircraft inside the bounding boxes
+        of the experiment areas (or the deletion area when there is none) plus a
+        buffer. Aircraft outside the buffer get no conflicts, and so no
+        resolutions either. The default buffer is the largest protected zone
+        plus the distance two aircraft close in the lookahead time, so no pair
+        with an aircraft inside the areas is missed. '''
+    def nearby(self, ownship, rpz, dtlookahead):
+        ''' Indices of the aircraft within the buffer around the areas, or None when there are no areas. '''
+        area = traf.areadel
+        names = area.expareas or [area.exparea or area.delarea]
+        # Undefined or deleted areas are left out, without any area all aircraft are checked
+        areas = [area.compile_area(name) for name in names]
+        areas = [compiled for compiled in areas if compiled.kind != 'empty']
+        if not area.active or not areas:
+            return None
+        if buffer is None:
+            dist = np.max(rpz, initial=0.0) + np.max(dtlookahead, initial=0.0) * 2.0 * np.max(ownship.gs, initial=0.0)
+        else:
+            dist = buffer * nm
+        dlat = np.degrees(dist / 6371000.0)
+        lat, lon = np.asarray(ownship.lat), np.asarray(ownship.lon)
+        near = np.zeros(ownship.ntraf, dtype=bool)
+        for compiled in areas:
+            latmin, latmax, lonmin, lonmax = compiled.bbox
+            dlon = dlat / max(np.cos(np.radians(max(abs(latmin), abs(latmax)) + dlat)), 1e-6)
+            near |= (lat >= latmin - dlat) & (lat <= latmax + dlat) & \
+                (lon >= lonmin - dlon) & (lon <= lonmax + dlon)
+        return np.flatnonzero(near)
+
+    def detect(self, ownship, intruder, rpz, hpz, dtlookahead):
+        idx = self.nearby(ownship, rpz, dtlookahead)
+        if idx is None or len(idx) == ownship.ntraf:
+            return super().detect(ownship, intruder, rpz, hpz, dtlookahead)
+
+        # Detection on the subset, the per aircraft settings taken along
+        sub = lambda value: np.asarray(value)[idx] if np.ndim(value) else value
+        confpairs, lospairs, inconf, tcpamax, qdr, dist, dcpa, tcpa, tLOS = \
+            super().detect(Subset(ownship, idx), Subset(intruder, idx), sub(rpz), sub(hpz), sub(dtlookahead))
+
+        # The pairs and their values are per pair of callsigns, only the per
+        # aircraft outputs go back to all aircraft
+        inconf_all = np.zeros(ownship.ntraf, dtype=bool)
+        inconf_all[idx] = np.asarray(inconf).reshape(-1)
+        tcpamax_all = np.zeros(ownship.ntraf)
+        tcpamax_all[idx] = np.asarray(tcpamax).reshape(-1)
+        return confpairs, lospairs, inconf_all, tcpamax_all, qdr, dist, dcpa, tcpa, tLOS
@@ -1,13 +1,18 @@
 """ BlueSky deletion area plugin. This plugin can use an area definition to
     delete aircraft that enter the area. Statistics on these flights can be
-    logged with the FLSTLOG logger. """
+    logged with the FLSTLOG logger. The FLSTLOG and CONFLOG files are written
+    by a background thread, so the simulation does not wait on the disk. """
 # Modified by M. Faza Abel J. M.
 import numpy as np
 # Import the global bluesky objects. Uncomment the ones you need
-from bluesky import traf, sim  #, settings, navdb, traf, sim, scr, tools
-from bluesky.tools import datalog, areafilter
+from bluesky import traf, sim, settings, stack  #, navdb, traf, sim, scr, tools
+from bluesky.tools import areafilter
 from bluesky.core import Entity, timed_function
 from bluesky.tools.aero import ft,kts,nm,fpm
+from bluesky.plugins.bufferedlog import BufferedLog
+from bluesky.plugins.callsigns import pair_indices
+from bluesky.plugins.stableuid import stable_uids
+from bluesky.plugins.areashapes import CompiledArea, AreaSet, EMPTY
 
 # Log parameters for the flight statistics log
 flstheader = \
@@ -37,7 +42,8 @@ flstheader = \
     'Pilot ALT [ft], ' + \
     'Pilot SPD (TAS) [kts], ' + \
     'Pilot HDG [deg], ' + \
-    'Pilot VS [fpm]'  + '\n'
+    'Pilot VS [fpm], ' + \
+    'Experiment area [-] (multi-area mode only)' + '\n'
 
 confheader = \
     '#######################################################\n' + \
@@ -46,7 +52,8 @@ confheader = \
     '#######################################################\n\n' + \
     'Parameters [Units]:\n' + \
     'Simulation time [s], ' + \
-    'Total number of conflicts in exp area [-]\n'
+    'Total number of conflicts in exp area [-], ' + \
+    'Experiment area [-] (multi-area mode only)\n'
 
 # Global data
 area = None
@@ -58,6 +65,8 @@ def init_plugin():
     # Addtional initilisation code
     global area
     area = AreaDel()
+    # Conflict detection of the areaCD plugin reads the areas
+    traf.areadel = area
 
     # Configuration parameters
     config = {
@@ -81,11 +90,29 @@ def init_plugin():
             lambda *args: area.set_area(*args, exparea=True),
             'Define experiment area (area of interest)'
         ],
+        'EXPAREAS': [
+            'EXPAREAS Shapename,Shapename,... or EXPAREAS OFF',
+            '[txt,...]',
+            area.set_areas,
+            'Define several experiment areas with per-area statistics'
+        ],
         'TAXI': [
             'TAXI ON/OFF [alt] : OFF auto deletes traffic below 1500 ft',
             'onoff[,alt]',
             area.set_taxi,
             'Switch on/off ground/low altitude mode, prevents auto-delete at 1500 ft'
+        ],
+        'FLSTLOG': [
+            'FLSTLOG ON/OFF',
+            '[onoff]',
+            lambda flag=None: area.set_log(area.flst, flag),
+            'Start a new flight statistics log file, or stop logging'
+        ],
+        'CONFLOG': [
+            'CONFLOG ON/OFF',
+            '[onoff]',
+            lambda flag=None: area.set_log(area.conflog, flag),
+            'Start a new conflict count log file, or stop logging'
         ]
     }
     # init_plugin() should always return these two dicts.
@@ -94,6 +121,8 @@ def init_plugin():
 class AreaDel(Entity):
     ''' Traffic area: delete traffic when it enters this area (so not when inside)'''
     def __init__(self):
+        # Stable aircraft numbers of the conflict keys, shared with the other plugins
+        self.uids = stable_uids()
         super().__init__()
         # Parameters of area
         self.active = False
@@ -101,12 +130,22 @@ class AreaDel(Entity):
         self.exparea = ''
         self.swtaxi = True  # Default ON: Doesn't do anything. See comments of set_taxi function below.
         self.swtaxialt = 1500.0  # Default alt for TAXI OFF
-        self.prevconfpairs = set()
+        self.prevconfkeys = np.array([], dtype=np.int64)  # Conflict pairs of the previous update
         self.confinside_all = 0
 
-        # The FLST logger
-        self.flst = datalog.crelog('FLSTLOG', None, flstheader)
-        self.conflog = datalog.crelog('CONFLOG', None, confheader)
+        # Multi-area mode: several experiment areas with per-area statistics.
+        # The per-area traffic arrays are N x A, and resized in create/delete.
+        self.expareas = []
+        self.confinside_areas = np.zeros(0, dtype=int)
+        self.reset_areas()
+
+        # Compiled areas: name -> (areafilter shape, compiled area), and the area set of the last check
+        self.compiled = dict()
+        self.areaset = None
+
+        # The FLST logger, files {name}_{scenname}_{timestamp}.log in the log path
+        self.flst = BufferedLog('FLSTLOG', flstheader, settings.log_path)
+        self.conflog = BufferedLog('CONFLOG', confheader, settings.log_path)
 
         with self.settrafarrays():
             self.insdel = np.array([], dtype=bool) # In deletion area or not
@@ -123,25 +162,129 @@ class AreaDel(Entity):
     def reset(self):
         ''' Reset area state when simulation is reset. '''
         super().reset()
+        # All logged rows are written, and the files closed
+        self.flst.stop()
+        self.conflog.stop()
         self.active = False
         self.delarea = ''
         self.exparea = ''
         self.swtaxi = True
         self.swtaxialt = 1500.0
         self.confinside_all = 0
+        self.prevconfkeys = np.array([], dtype=np.int64)
+        self.expareas = []
+        self.reset_areas(0)
+
+    def reset_areas(self, n=None):
+        ''' Clear the per-area arrays of n aircraft (default all), for the current
+            number of experiment areas. '''
+        shape = (traf.ntraf if n is None else n, len(self.expareas))
+        self.insexp_areas = np.zeros(shape, dtype=bool)
+        self.dstart2D_areas = np.zeros(shape)
+        self.dstart3D_areas = np.zeros(shape)
+        self.workstart_areas = np.zeros(shape)
+        self.entrytime_areas = np.zeros(shape)
+        self.confinside_areas = np.zeros(len(self.expareas), dtype=int)
 
     def create(self, n=1):
         ''' Create is called when new aircraft are created. '''
         super().create(n)
+        for name in ('insexp_areas', 'dstart2D_areas', 'dstart3D_areas', 'workstart_areas', 'entrytime_areas'):
+            arr = getattr(self, name)
+            setattr(self, name, np.concatenate((arr, np.zeros((n, arr.shape[1]), dtype=arr.dtype))))
         self.oldalt[-n:] = traf.alt[-n:]
         self.insdel[-n:] = False
         self.insexp[-n:] = False
         self.create_time[-n:] = sim.simt
 
+    def delete(self, idx):
+        ''' Delete is called when aircraft are deleted. '''
+        for name in ('insexp_areas', 'dstart2D_areas', 'dstart3D_areas', 'workstart_areas', 'entrytime_areas'):
+            setattr(self, name, np.delete(getattr(self, name), idx, axis=0))
+        super().delete(idx)
+
+    def compile_area(self, name):
+        ''' Compiled form of the named area, built once per shape. When the
+            shape is redefined under the same name it is compiled again. An
+            undefined or deleted area contains no aircraft, as in areafilter.checkInside. '''
+        if not areafilter.hasArea(name):
+            self.compiled.pop(name, None)
+            return EMPTY
+        shape = areafilter.basic_shapes[name]
+        if name not in self.compiled or self.compiled[name][0] is not shape:
+            if isinstance(shape, areafilter.Circle):
+                area = CompiledArea('circle', (shape.clat, shape.clon), shape.top, shape.bottom, shape.r)
+            elif isinstance(shape, areafilter.Poly):
+                area = CompiledArea('poly', shape.coordinates, shape.top, shape.bottom)
+            else:
+                area = CompiledArea('other', contains=shape.contains)
+            self.compiled[name] = (shape, area)
+        return self.compiled[name][1]
+
+    def membership(self, names):
+        ''' N x A membership matrix of the named areas, from their compiled forms.
+            All circles are checked in one pass, and areas given more than once
+            (the experiment area being the deletion area) are checked once. '''
+        areas = [self.compile_area(name) for name in names]
+        if self.areaset is None or len(areas) != len(self.areaset.cols) or \
+                any(area is not self.areaset.areas[col] for area, col in zip(areas, self.areaset.cols)):
+            self.areaset = AreaSet(areas)
+        return self.areaset.membership(traf.lat, traf.lon, traf.alt)
+
+    def flstcols(self, idx, entrytime, dstart2D, dstart3D, workstart):
+        ''' FLST log columns of the aircraft idx, with their experiment area entry values. '''
+        return [np.array(traf.id)[idx],
+                self.create_time[idx],
+                sim.simt - entrytime,
+                (self.distance2D[idx] - dstart2D)/nm,
+                (self.distance3D[idx] - dstart3D)/nm,
+                (traf.work[idx] - workstart)*1e-6,
+                traf.lat[idx],
+                traf.lon[idx],
+                traf.alt[idx]/ft,
+                traf.tas[idx]/kts,
+                traf.vs[idx]/fpm,
+                traf.hdg[idx],
+                traf.cr.active[idx],
+                traf.aporasas.alt[idx]/ft,
+                traf.aporasas.tas[idx]/kts,
+                traf.aporasas.vs[idx]/fpm,
+                traf.aporasas.hdg[idx]]
+
+    def update_areas(self, inside, idx1, idx2):
+        ''' Per-area statistics in multi-area mode, from the N x A membership
+            matrix and the aircraft indices of the new conflict pairs. '''
+        names = np.array(self.expareas, dtype=object)
+        # New conflicts where at least one of the aircraft is inside, per area
+        nnewconf = np.count_nonzero(inside[idx1] | inside[idx2], axis=0)
+        if np.any(nnewconf):
+            self.confinside_areas += nnewconf
+            logged = nnewconf > 0
+            self.conflog.log(sim.simt, self.confinside_areas[logged], names[logged])
+
+        # Register distance values upon entry of each experiment area
+        newentries = ~self.insexp_areas & inside
+        self.dstart2D_areas = np.where(newentries, self.distance2D[:, np.newaxis], self.dstart2D_areas)
+        self.dstart3D_areas = np.where(newentries, self.distance3D[:, np.newaxis], self.dstart3D_areas)
+        self.workstart_areas = np.where(newentries, traf.work[:, np.newaxis], self.workstart_areas)
+        self.entrytime_areas = np.where(newentries, sim.simt, self.entrytime_areas)
+
+        # Log flight statistics of all area exits in one call
+        idx, col = np.nonzero(self.insexp_areas & ~inside)
+        self.insexp_areas = inside
+        if idx.size:
+            self.flst.log(sim.simt,
+                          *self.flstcols(idx, self.entrytime_areas[idx, col], self.dstart2D_areas[idx, col],
+                                         self.dstart3D_areas[idx, col], self.workstart_areas[idx, col]),
+                          names[col])
+
     @timed_function(name='AREADEL', dt=1.0)
     def update(self, dt):
         ''' Update flight efficiency metrics
             2D and 3D distance [m], and work done (force*distance) [J] '''
+        # Log files that could not be written, and the rows lost
+        for msg in self.flst.pop_errors() + self.conflog.pop_errors():
+            stack.stack(f'ECHO {msg}')
         if self.active:
             resultantspd = np.sqrt(traf.gs * traf.gs + traf.vs * traf.vs)
             self.distance2D += dt * traf.gs
@@ -149,9 +292,12 @@ class AreaDel(Entity):
 
             # Find out which aircraft are currently inside the experiment area, and
             # determine which aircraft need to be deleted.
-            insdel = areafilter.checkInside(self.delarea, traf.lat, traf.lon, traf.alt)
-            insexp = insdel if not self.exparea else \
-                areafilter.checkInside(self.exparea, traf.lat, traf.lon, traf.alt)
+            # All areas are checked in one pass, an experiment area equal to
+            # the deletion area shares its result
+            inside = self.membership([self.delarea, self.exparea or self.delarea] + self.expareas)
+            insdel = inside[:, 0]
+            insexp = inside[:, 1]
+            inside_areas = inside[:, -len(self.expareas):] if self.expareas else None
             # Find all aircraft that were inside in the previous timestep, but no
             # longer are in the current timestep
             delidx = np.where(np.array(self.insdel) * (np.array(insdel) == True))[0]
@@ -162,28 +308,22 @@ class AreaDel(Entity):
             # Store statistics for all new conflict pairs
             # Conflict pairs detected in the current timestep that were not yet
             # present in the previous timestep
-            confpairs_new = list(set(traf.cd.confpairs) - self.prevconfpairs)
-            if confpairs_new:
+            keys, idx1, idx2 = self.confkeys()
+            new = np.isin(keys, self.prevconfkeys, assume_unique=True, invert=True)
+            self.prevconfkeys = keys
+            if self.expareas:
+                # Multi-area mode: the statistics are kept per experiment area
+                self.update_areas(inside_areas, idx1[new], idx2[new])
+            elif np.any(new):
                 # If necessary: select conflict geometry parameters for new conflicts
-                # idxdict = dict((v, i) for i, v in enumerate(traf.cd.confpairs))
-                # idxnew = [idxdict.get(i) for i in confpairs_new]
-                # dcpa_new = np.asarray(traf.cd.dcpa)[idxnew]
-                # tcpa_new = np.asarray(traf.cd.tcpa)[idxnew]
-                # tLOS_new = np.asarray(traf.cd.tLOS)[idxnew]
-                # qdr_new = np.asarray(traf.cd.qdr)[idxnew]
-                # dist_new = np.asarray(traf.cd.dist)[idxnew]
-
-                newconf_unique = {frozenset(pair) for pair in confpairs_new}
-                ac1, ac2 = zip(*newconf_unique)
-                idx1 = traf.id2idx(ac1)
-                idx2 = traf.id2idx(ac2)
-                newconf_inside = np.logical_or(insexp[idx1], insexp[idx2])
+                # from traf.cd (dcpa, tcpa, tLOS, qdr, dist) with the pair indices
+                # returned by confkeys
+                newconf_inside = np.logical_or(insexp[idx1[new]], insexp[idx2[new]])
 
                 nnewconf_exp = np.count_nonzero(newconf_inside)
                 if nnewconf_exp:
                     self.confinside_all += nnewconf_exp
-                    self.conflog.log(self.confinside_all)
-            self.prevconfpairs = set(traf.cd.confpairs)
+                    self.conflog.log(sim.simt, self.confinside_all)
 
             # Register distance values upon entry of experiment area
             newentries = np.logical_not(self.insexp) * insexp
@@ -197,25 +337,11 @@ class AreaDel(Entity):
             # Update insexp
             self.insexp = insexp
 
-            if np.any(exits):
+            if np.any(exits) and not self.expareas:
                 self.flst.log(
-                    np.array(traf.id)[exits],
-                    self.create_time[exits],
-                    sim.simt - self.entrytime[exits],
-                    (self.distance2D[exits] - self.dstart2D[exits])/nm,
-                    (self.distance3D[exits] - self.dstart3D[exits])/nm,
-                    (traf.work[exits] - self.workstart[exits])*1e-6,
-                    traf.lat[exits],
-                    traf.lon[exits],
-                    traf.alt[exits]/ft,
-                    traf.tas[exits]/kts,
-                    traf.vs[exits]/fpm,
-                    traf.hdg[exits],
-                    traf.cr.active[exits],
-                    traf.aporasas.alt[exits]/ft,
-                    traf.aporasas.tas[exits]/kts,
-                    traf.aporasas.vs[exits]/fpm,
-                    traf.aporasas.hdg[exits])
+                    sim.simt,
+                    *self.flstcols(exits, self.entrytime[exits], self.dstart2D[exits],
+                                   self.dstart3D[exits], self.workstart[exits]))
 
             # delete all aicraft in self.delidx
             if len(delidx) > 0:
@@ -231,6 +357,20 @@ class AreaDel(Entity):
             if len(delidxalt) > 0:
                 traf.delete(list(delidxalt))
 
+    def confkeys(self):
+        ''' Current conflict pairs as sorted, unique int64 keys built from the
+            stable aircraft numbers: (min << 32) | max, so a pair and its mirror
+            give the same key and keys stay valid when aircraft are deleted.
+            Also returns the aircraft indices of both members of each key. '''
+        # Pairs with an aircraft deleted since the last conflict detection are left out
+        idx, _ = pair_indices(traf.id, traf.cd.confpairs)
+        if len(idx) == 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=int), np.array([], dtype=int)
+        uid = self.uids.uid[idx]
+        keys = (uid.min(axis=1) << 32) | uid.max(axis=1)
+        keys, first = np.unique(keys, return_index=True)
+        return keys, idx[first, 0], idx[first, 1]
+
     def set_area(self, *args, exparea=False):
         ''' Set Experiment Area. Aircraft leaving the experiment area are deleted.
         Input can be existing shape name, or a box with optional altitude constraints.'''
@@ -249,10 +389,11 @@ class AreaDel(Entity):
                     self.exparea = args[0]
                 else:
                     self.delarea = args[0]
+                self.compile_area(args[0])
 
                 self.active = True
-                self.flst.start()
-                self.conflog.start()
+                self.flst.start(stack.get_scenname())
+                self.conflog.start(stack.get_scenname())
                 return True, f'{msgname} is set to {args[0]}'
             if args[0][:2] =='OF':
                 # switch off the area and reset the logger
@@ -276,14 +417,46 @@ class AreaDel(Entity):
             else:
                 self.delarea = 'DELAREA'
                 areafilter.defineArea('DELAREA', 'BOX', args[:4], *args[4:])
-            self.flst.start()
-            self.conflog.start()
+            self.compile_area(self.exparea if exparea else self.delarea)
+            self.flst.start(stack.get_scenname())
+            self.conflog.start(stack.get_scenname())
             return True, f'{msgname} is ON. Area name is: {"EXP" if exparea else "DEL"}AREA'
 
         return False,  'Incorrect arguments' + \
                        '\nAREA Shapename/OFF or\n Area lat,lon,lat,lon,[top,bottom]'
 
+    def set_areas(self, *names):
+        ''' Set several experiment areas, with flight and conflict statistics
+            per area. The FLST and CONF rows get the area name as last column. '''
+        if not names:
+            return True, 'Experiment areas: ' + (', '.join(self.expareas) if self.expareas else 'none')
+        if len(names) == 1 and names[0][:2] == 'OF':
+            self.expareas = []
+            self.reset_areas()
+            return True, 'Multi-area mode is switched OFF'
+        unknown = [name for name in names if not areafilter.hasArea(name)]
+        if unknown:
+            return False, 'Shapename(s) unknown: ' + ', '.join(unknown)
+        if not self.delarea:
+            return False, 'Define a deletion area with AREADEL first'
+        self.expareas = list(names)
+        for name in names:
+            self.compile_area(name)
+        self.reset_areas()
+        return True, f'Experiment areas are set to {", ".join(names)}'
+
     def set_taxi(self, flag,alt=1500*ft):
         ''' Taxi ON/OFF to autodelete below a certain altitude if taxi is off'''
         self.swtaxi = flag # True =  taxi allowed, False = autodelete below swtaxialt
         self.swtaxialt = alt
+
+    def set_log(self, log, flag=None):
+        ''' Start (a new file) or stop one of the buffered logs. Defining an
+            area with AREADEL or EXP starts both logs. '''
+        if flag is None:
+            return True, f'{log.name} is ' + (f'ON, file {log.fname}' if log.active else 'OFF')
+        if flag:
+            log.start(stack.get_scenname())
+        else:
+            log.stop()
+        return True, f'{log.name} is ' + ('ON' if flag else 'OFF')
@@ -0,0 +1,91 @@
+# Compiled area shapes for the membership checks of AreaDel
+
+import numpy as np
+import shapely
+from shapely import Polygon
+
+from bluesky.plugins.geometry import nm, Rearth, polygon_mask
+
+class CompiledArea:
+    ''' An area compiled for fast membership checks. kind is 'circle' (centre
+        and radius [nm]), 'poly' (flat lat,lon list as in areafilter), or
+        'other' with a contains(lat, lon, alt) function for any other shape.
+        An 'empty' area (an area name that is not defined) contains no aircraft.
+        Altitudes [m] are inclusive, as in areafilter. '''
+    def __init__(self, kind, coords=(), top=1e9, bottom=-1e9, radius=0.0, contains=None):
+        self.kind = kind
+        self.top, self.bottom = top, bottom
+        self.contains = contains
+        if kind == 'circle':
+            self.clat, self.clon = coords
+            self.r = radius
+            # The kwikdist of the circle edge is the radius, 1% margin for its mean latitude cosine
+            dlat = 1.01 * np.degrees(radius * nm / Rearth)
+            dlon = dlat / max(np.cos(np.radians(abs(self.clat) + dlat)), 1e-6)
+            self.bbox = (self.clat - dlat, self.clat + dlat, self.clon - dlon, self.clon + dlon)
+        elif kind == 'poly':
+            # Same axis order as the areafilter polygons: x is latitude, y is longitude
+            self.polygon = Polygon(np.reshape(coords, (-1, 2)))
+            shapely.prepare(self.polygon)
+            self.polybounds = shapely.bounds(self.polygon)
+            latmin, lonmin, latmax, lonmax = self.polybounds
+            self.bbox = (latmin, latmax, lonmin, lonmax)
+        elif kind == 'empty':
+            self.bbox = (np.inf, -np.inf, np.inf, -np.inf)
+        else:
+            self.bbox = (-np.inf, np.inf, -np.inf, np.inf)
+
+# Compiled form of all undefined areas
+EMPTY = CompiledArea('empty')
+
+class AreaSet:
+    ''' Membership of all aircraft in a list of compiled areas in one pass.
+        An area that occurs more than once in the list (for instance the
+        experiment area being the deletion area) is checked only once. '''
+    def __init__(self, areas):
+        self.areas = []
+        self.cols = []
+        for area in areas:
+            for k, known in enumerate(self.areas):
+                if known is area:
+                    self.cols.append(k)
+                    break
+            else:
+                self.cols.append(len(self.areas))
+                self.areas.append(area)
+        bbox = np.array([area.bbox for area in self.areas]).reshape(-1, 4).T
+        self.latmin, self.latmax, self.lonmin, self.lonmax = bbox
+        self.top = np.array([area.top for area in self.areas])
+        self.bottom = np.array([area.bottom for area in self.areas])
+        self.circ = np.array([k for k, area in enumerate(self.areas) if area.kind == 'circle'], dtype=int)
+        self.clat = np.array([self.areas[k].clat for k in self.circ])
+        self.clon = np.array([self.areas[k].clon for k in self.circ])
+        self.r = np.array([self.areas[k].r for k in self.circ])
+
+    def membership(self, lat, lon, alt):
+        ''' N x A membership matrix, in the order of the areas given. '''
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+        alt = np.asarray(alt, dtype=float)
+        # Box and altitude band of all areas first
+        latc, lonc, altc = lat[:, np.newaxis], lon[:, np.newaxis], alt[:, np.newaxis]
+        inside = (latc >= self.latmin) & (latc <= self.latmax) & (lonc >= self.lonmin) & \
+            (lonc <= self.lonmax) & (altc >= self.bottom) & (altc <= self.top)
+
+        # Circles: kwikdist of the candidate (aircraft, circle) pairs only
+        if self.circ.size:
+            ip, ic = np.nonzero(inside[:, self.circ])
+            dlat = np.radians(self.clat[ic] - lat[ip])
+            dlon = np.radians((self.clon[ic] - lon[ip] + 180.0) % 360.0 - 180.0)
+            cavelat = np.cos(np.radians(lat[ip] + self.clat[ic]) * 0.5)
+            dist = Rearth * np.sqrt(dlat * dlat + dlon * dlon * cavelat * cavelat) / nm
+            inside[ip, self.circ[ic]] = dist <= self.r[ic]
+
+        # Polygons: prepared polygon test of the candidates only
+        for k, area in enumerate(self.areas):
+            if area.kind == 'poly':
+                cand = np.flatnonzero(inside[:, k])
+                inside[cand, k] = polygon_mask(area.polygon, area.polybounds, lat[cand], lon[cand])
+            elif area.kind == 'other':
+                inside[:, k] = area.contains(lat, lon, alt)
+        return inside[:, self.cols]
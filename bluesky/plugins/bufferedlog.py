@@ -0,0 +1,150 @@
+# Log files written by a background thread, for loggers called every tick
+
+import atexit
+import datetime
+import os
+import queue
+import threading
+
+import numpy as np
+
+class BufferedLog:
+    ''' Text log in the format of the BlueSky data loggers: header lines starting
+        with '# ', then one comma separated row per logged item, starting with
+        the sim time. Rows are kept in column buffers of blocksize rows, and
+        written in one block by a background thread when a buffer is full, when
+        its first row is older than interval seconds of sim time, on flush(),
+        when a new file is started and when Python exits. Errors of the writer
+        and the number of rows they cost are collected for the caller, see
+        pop_errors(). '''
+    def __init__(self, name, header, path='output', blocksize=4096, interval=60.0):
+        self.name = name
+        self.header = header
+        self.path = path
+        self.blocksize = blocksize
+        self.interval = interval
+        self.tfirst = 0.0       # Sim time of the first row in the buffers
+        self.fname = ''
+        self.active = False
+        self.cols = None        # Column buffers, allocated at the first row
+        self.nrows = 0          # Rows in the column buffers
+
+        self.queue = queue.Queue()
+        self.errors = queue.Queue()     # Messages of the writer for the caller
+        self.writer = threading.Thread(target=self.run, name=f'{name} writer', daemon=True)
+        self.writer.start()
+        # Rows still in the buffers or the queue are written before Python exits
+        atexit.register(self.close)
+
+    def start(self, scenname=''):
+        ''' Start a new log file {name}_{scenname}_{timestamp}.log in the log path. '''
+        self.flush()
+        timestamp = datetime.datetime.now().strftime('%Y%m%d_%H-%M-%S')
+        self.fname = os.path.join(self.path, f'{self.name}_{scenname}_{timestamp}.log')
+        self.queue.put(('open', self.fname, self.header))
+        self.active = True
+
+    def log(self, t, *cols):
+        ''' Add rows: sim time t and the columns, each a scalar or an array with one value per row. '''
+        if not self.active:
+            return
+        cols = np.broadcast_arrays(t, *(np.asarray(col) for col in cols))
+        n = len(cols[0]) if cols[0].ndim else 1
+        cols = [col.reshape(-1) for col in cols]
+        if n == 0:
+            return
+        if self.cols is not None and len(cols) != len(self.cols):
+            # Rows with other columns go in new buffers
+            self.handoff()
+            self.cols = None
+        if self.cols is None:
+            # Numbers are kept as floats, everything else (callsigns, flags) as objects
+            self.cols = [np.empty(self.blocksize, dtype=float if np.issubdtype(col.dtype, np.floating)
+                                  else object) for col in cols]
+        if self.nrows == 0:
+            self.tfirst = cols[0][0]
+        start = 0
+        while start < n:
+            k = min(n - start, self.blocksize - self.nrows)
+            for buf, col in zip(self.cols, cols):
+                buf[self.nrows:self.nrows + k] = col[start:start + k]
+            self.nrows += k
+            start += k
+            if self.nrows == self.blocksize:
+                self.handoff()
+        if self.nrows and cols[0][-1] - self.tfirst >= self.interval:
+            self.handoff()
+
+    def handoff(self):
+        ''' Pass the filled part of the buffers to the writer, and continue in new buffers. '''
+        if self.nrows:
+            self.queue.put(('rows', self.cols, self.nrows))
+            self.cols = [np.empty(self.blocksize, dtype=buf.dtype) for buf in self.cols]
+            self.nrows = 0
+
+    def flush(self, wait=False):
+        ''' Pass all buffered rows to the writer, and optionally wait until they are on disk. '''
+        self.handoff()
+        if wait:
+            self.queue.join()
+
+    def stop(self):
+        ''' Write all rows and close the file, without waiting for the writer. '''
+        if self.active:
+            self.handoff()
+            self.queue.put(('close',))
+            self.active = False
+            self.cols = None
+
+    def close(self):
+        ''' Write all rows, close the file and wait until the writer is done. '''
+        self.stop()
+        self.queue.join()
+
+    def pop_errors(self):
+        ''' Messages of the writer since the last call: files that could not be
+            written, and the number of rows lost for each of them. '''
+        msgs = []
+        while not self.errors.empty():
+            msgs.append(self.errors.get())
+        return msgs
+
+    def run(self):
+        ''' Writer thread: formats and writes the blocks of rows in the queue. '''
+        f = None
+        fname = ''
+        lost = 0        # Rows of the current file that could not be written
+        while True:
+            msg = self.queue.get()
+            try:
+                if msg[0] == 'open':
+                    if f:
+                        f.close()
+                    f = None
+                    fname, lost = msg[1], 0
+                    os.makedirs(os.path.dirname(fname) or '.', exist_ok=True)
+                    f = open(fname, 'w')
+                    f.write(''.join(f'# {line}\n' for line in msg[2].split('\n')))
+                elif msg[0] == 'rows':
+                    cols, n = msg[1], msg[2]
+                    if f is None:
+                        lost += n
+                    else:
+                        fmt = ','.join('%.6f' if col.dtype == float else '%s' for col in cols) + '\n'
+                        f.write(''.join([fmt % row for row in zip(*(col[:n].tolist() for col in cols))]))
+                        f.flush()
+                elif msg[0] == 'close':
+                    if f:
+                        f.close()
+                    f = None
+                    if lost:
+                        self.errors.put(f'{self.name}: {lost} rows not written to {fname}')
+                    lost = 0
+            except OSError as e:
+                # The writer keeps running, the rows of this file are counted as lost
+                self.errors.put(f'{self.name}: cannot write {fname}: {e}')
+                if msg[0] == 'rows':
+                    lost += msg[2]
+                f = None
+            finally:
+                self.queue.task_done()
@@ -0,0 +1,60 @@
+# Callsign allocation and aircraft lookup shared by the plugins
+
+import numpy as np
+
+# Allocators per callsign prefix, so every spawner using the same prefix shares one
+_allocators = dict()
+
+def allocator(prefix):
+    ''' Return the shared allocator of the given callsign prefix. '''
+    if prefix not in _allocators:
+        _allocators[prefix] = CallsignAllocator(prefix)
+    return _allocators[prefix]
+
+class CallsignAllocator:
+    ''' Unique callsign numbers from a monotonic counter. Numbers are never
+        handed out twice in a run, not even after the aircraft is deleted, so
+        conflict pairs and log rows keyed by callsign always belong to one flight. '''
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.reset()
+
+    def reset(self):
+        ''' Start counting from zero again, as when the simulation is reset. '''
+        self.counter = 0
+
+    def allocate(self, n):
+        ''' Return n new unique numbers. '''
+        numbers = np.arange(self.counter, self.counter + n)
+        self.counter += n
+        return numbers
+
+    def callsigns(self, numbers):
+        ''' Callsigns of the given numbers. '''
+        return [f'{self.prefix}{num}' for num in np.asarray(numbers).tolist()]
+
+def pair_indices(ids, pairs):
+    ''' Indices in ids of both callsigns of each pair (P x 2), with one sort of
+        the callsigns and a binary search. Pairs with a callsign that is not in
+        ids, such as stale conflict pairs of an aircraft deleted since conflict
+        detection last ran, are dropped. Also returns the mask of the kept pairs. '''
+    ids = np.asarray(ids)
+    pairs = np.asarray(pairs).reshape(-1, 2)
+    if len(ids) == 0 or len(pairs) == 0:
+        return np.zeros((0, 2), dtype=int), np.zeros(len(pairs), dtype=bool)
+    order = np.argsort(ids)
+    sids = ids[order]
+    pos = np.minimum(np.searchsorted(sids, pairs), len(ids) - 1)
+    found = (sids[pos] == pairs).all(axis=1)
+    return order[pos[found]], found
+
+def uid_indices(uids, wanted):
+    ''' Indices in the sorted uid array of the current traffic (see stableuid)
+        of the wanted uids, with a binary search. Also returns the mask of the
+        uids found: the aircraft of the others have been deleted. '''
+    uids = np.asarray(uids)
+    wanted = np.asarray(wanted)
+    if len(uids) == 0:
+        return np.zeros(wanted.shape, dtype=int), np.zeros(wanted.shape, dtype=bool)
+    idx = np.minimum(np.searchsorted(uids, wanted), len(uids) - 1)
+    return idx, uids[idx] == wanted
@@ -0,0 +1,16 @@
+# Plain geometry constants and helpers shared by the plugins
+
+import numpy as np
+import shapely
+
+nm = 1852.0         # Nautical mile [m], as in bluesky.tools.aero
+Rearth = 6371000.0  # Mean earth radius [m], as in kwikdist
+
+def polygon_mask(polygon, bounds, x, y):
+    ''' Boolean mask of the points (x, y) inside a prepared polygon. Only the
+        points within the bounding box of the polygon get the exact test. '''
+    xmin, ymin, xmax, ymax = bounds
+    mask = (x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax)
+    cand = np.flatnonzero(mask)
+    mask[cand] = shapely.contains_xy(polygon, x[cand], y[cand])
+    return mask
@@ -0,0 +1,175 @@
+# Vectorised multi-sensor tracker for the airport OLS plugins
+
+import numpy as np
+
+class Tracker:
+    ''' Constant-velocity Kalman filter over all tracks at once, in a local
+        east-north frame [m]. The state of each track is (x, y, vx, vy), the
+        states and covariances of all tracks are stacked in T x 4 and T x 4 x 4
+        arrays. Plots are gated with the Mahalanobis distance, and associated
+        in a few rounds of mutual nearest neighbours. Plots that do not fit any
+        track start a new, tentative track. Tracks carry the label of their last
+        plot, so the simulation can tell which aircraft a track follows. '''
+    def __init__(self, q=2.0, r=25.0, gate=9.21, vmax=50.0, nconfirm=3, maxcoast=10.0):
+        self.q = q                  # Process noise, acceleration spectral density [m2/s3]
+        self.r = r                  # Plot position standard deviation [m]
+        self.gate = gate            # Gate on the squared Mahalanobis distance (2 dof, 99%)
+        self.vmax = vmax            # Standard deviation of the velocity of a new track [m/s]
+        self.nconfirm = nconfirm    # Number of plots to confirm a track
+        self.maxcoast = maxcoast    # Tracks without plots for this long are dropped [s]
+        self.reset()
+
+    def reset(self):
+        ''' Drop all tracks. '''
+        self.x = np.zeros((0, 4))
+        self.P = np.zeros((0, 4, 4))
+        self.t = np.zeros(0)                        # Time of the last update [s]
+        self.hits = np.zeros(0, dtype=int)          # Number of plots
+        self.label = np.zeros(0, dtype=int)         # Label of the last plot
+        self.trackid = np.zeros(0, dtype=int)
+        self.nextid = 0
+
+    def __len__(self):
+        return len(self.t)
+
+    @property
+    def confirmed(self):
+        return self.hits >= self.nconfirm
+
+    def predict(self, x, P, dt):
+        ''' States and covariances x (K x 4), P (K x 4 x 4) predicted over dt (K) seconds. '''
+        dt = np.asarray(dt, dtype=float)
+        xp = x.copy()
+        xp[:, :2] += dt[:, np.newaxis] * x[:, 2:]
+
+        # F P F' with F = [[I, dt I], [0, I]], written out per block
+        Pp = P.copy()
+        dt1 = dt[:, np.newaxis, np.newaxis]
+        Pp[:, :2, :] += dt1 * P[:, 2:, :]
+        Pp[:, :, :2] += dt1 * Pp[:, :, 2:]
+
+        # White noise acceleration
+        q3, q2, q1 = self.q * dt ** 3 / 3.0, self.q * dt ** 2 / 2.0, self.q * dt
+        for i in range(2):
+            Pp[:, i, i] += q3
+            Pp[:, i, i + 2] += q2
+            Pp[:, i + 2, i] += q2
+            Pp[:, i + 2, i + 2] += q1
+        return xp, Pp
+
+    def innovation(self, ip, it, tplot, z):
+        ''' Predictions of the tracks it to the times of the plots ip, with the
+            innovations, inverse innovation covariances and squared Mahalanobis distances. '''
+        xp, Pp = self.predict(self.x[it], self.P[it], np.maximum(tplot[ip] - self.t[it], 0.0))
+        nu = z[ip] - xp[:, :2]
+        S = Pp[:, :2, :2] + self.r * self.r * np.eye(2)
+        det = S[:, 0, 0] * S[:, 1, 1] - S[:, 0, 1] * S[:, 1, 0]
+        Sinv = np.stack((np.stack((S[:, 1, 1], -S[:, 0, 1]), axis=-1),
+                         np.stack((-S[:, 1, 0], S[:, 0, 0]), axis=-1)), axis=1) / det[:, np.newaxis, np.newaxis]
+        d2 = np.einsum('ki,kij,kj->k', nu, Sinv, nu)
+        return xp, Pp, nu, Sinv, d2
+
+    def candidates(self, z, plots):
+        ''' (plot, track) pairs that are close enough to be gated exactly. '''
+        if len(self) == 0 or len(plots) == 0:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+        # Coarse gate from the largest position uncertainty of all tracks,
+        # with the tracks moved to the time of the last plot
+        dtmax = np.maximum(plots.max() - self.t, 0.0)
+        pos = self.x[:, :2] + dtmax[:, np.newaxis] * self.x[:, 2:]
+        dt2 = dtmax * dtmax
+        var = np.maximum(self.P[:, 0, 0] + dt2 * self.P[:, 2, 2], self.P[:, 1, 1] + dt2 * self.P[:, 3, 3]) + \
+            self.q * dtmax * dt2 / 3.0 + self.r * self.r
+        reach = np.sqrt(self.gate * var.max())
+
+        # Tracks sorted from west to east, each plot is compared with the strip
+        # of tracks within reach in the east, and then filtered on the north
+        order = np.argsort(pos[:, 0])
+        xs = pos[order, 0]
+        lo = np.searchsorted(xs, z[:, 0] - reach)
+        cnt = np.searchsorted(xs, z[:, 0] + reach, side='right') - lo
+        ip = np.repeat(np.arange(len(z)), cnt)
+        it = order[np.arange(cnt.sum()) - np.repeat(np.cumsum(cnt) - cnt - lo, cnt)]
+        near = np.abs(pos[it, 1] - z[ip, 1]) <= reach
+        return ip[near], it[near]
+
+    def update(self, tplot, x, y, label):
+        ''' Process one batch of plots: plot times [s], positions [m] and labels. '''
+        tplot = np.asarray(tplot, dtype=float)
+        z = np.column_stack((x, y)).astype(float)
+        label = np.asarray(label, dtype=int)
+        left = np.arange(len(tplot))
+
+        # A track can get one plot per round, so every sensor seeing the same
+        # target gets its turn. New tracks are started from the plots left over.
+        for _ in range(8):
+            if left.size == 0:
+                break
+            ip, it = self.candidates(z[left], tplot[left])
+            ip = left[ip]
+            xp, Pp, nu, Sinv, d2 = self.innovation(ip, it, tplot, z)
+            ingate = d2 < self.gate
+            ip, it, d2 = ip[ingate], it[ingate], d2[ingate]
+            xp, Pp, nu, Sinv = xp[ingate], Pp[ingate], nu[ingate], Sinv[ingate]
+
+            pick = self.assign(ip, it, d2)
+            if pick.size:
+                ip, it = ip[pick], it[pick]
+                # Kalman gain K = P H' S^-1, H selects the position
+                K = np.einsum('kij,kjl->kil', Pp[pick][:, :, :2], Sinv[pick])
+                self.x[it] = xp[pick] + np.einsum('kij,kj->ki', K, nu[pick])
+                self.P[it] = Pp[pick] - np.einsum('kij,kjl->kil', K, Pp[pick][:, :2, :])
+                self.t[it] = tplot[ip]
+                self.hits[it] += 1
+                self.label[it] = label[ip]
+                left = np.setdiff1d(left, ip, assume_unique=True)
+            elif left.size:
+                # Start new tracks, one per patch of plots, the rest is
+                # associated to them in the next round
+                cell = np.floor(z[left] / (3.0 * self.r)).astype(np.int64)
+                _, first = np.unique(cell, axis=0, return_index=True)
+                new = left[np.sort(first)]
+                self.start(tplot[new], z[new], label[new])
+                left = np.setdiff1d(left, new, assume_unique=True)
+
+    def assign(self, ip, it, d2):
+        ''' Indices of the gated pairs that are each other's nearest neighbour
+            (lowest Mahalanobis distance), so no plot or track is used twice. '''
+        if ip.size == 0:
+            return np.zeros(0, dtype=int)
+        order = np.lexsort((d2, ip))
+        bestplot = order[np.r_[True, ip[order][1:] != ip[order][:-1]]]      # Best track of each plot
+        order = np.lexsort((d2, it))
+        besttrack = order[np.r_[True, it[order][1:] != it[order][:-1]]]     # Best plot of each track
+        return np.intersect1d(bestplot, besttrack, assume_unique=True)
+
+    def start(self, t, z, label):
+        ''' Start tentative tracks at the plots, with an unknown velocity. '''
+        n = len(t)
+        x = np.zeros((n, 4))
+        x[:, :2] = z
+        P = np.zeros((n, 4, 4))
+        P[:, [0, 1], [0, 1]] = self.r * self.r
+        P[:, [2, 3], [2, 3]] = self.vmax * self.vmax
+        self.x = np.concatenate((self.x, x))
+        self.P = np.concatenate((self.P, P))
+        self.t = np.concatenate((self.t, t))
+        self.hits = np.concatenate((self.hits, np.ones(n, dtype=int)))
+        self.label = np.concatenate((self.label, label))
+        self.trackid = np.concatenate((self.trackid, np.arange(self.nextid, self.nextid + n)))
+        self.nextid += n
+
+    def prune(self, t):
+        ''' Drop the tracks that did not get a plot for maxcoast seconds. '''
+        keep = self.t >= t - self.maxcoast
+        if not keep.all():
+            self.x, self.P, self.t = self.x[keep], self.P[keep], self.t[keep]
+            self.hits, self.label, self.trackid = self.hits[keep], self.label[keep], self.trackid[keep]
+
+    def positions(self, t):
+        ''' Positions [m] of the confirmed tracks predicted to time t, with their
+            labels and track ids. '''
+        conf = self.confirmed
+        dt = np.maximum(t - self.t[conf], 0.0)
+        pos = self.x[conf, :2] + dt[:, np.newaxis] * self.x[conf, 2:]
+        return pos[:, 0], pos[:, 1], self.label[conf], self.trackid[conf]
@@ -0,0 +1,559 @@
+# Vectorised zone geometry helpers shared by the airport OLS plugins
+
+import heapq
+import json
+import os
+
+import numpy as np
+import shapely
+from shapely import Polygon
+
+from bluesky.plugins.callsigns import uid_indices
+from bluesky.plugins.geometry import nm, Rearth, polygon_mask
+
+# Compiled site files, so every plugin loading the same file shares one copy
+_sites = dict()
+
+def same_tick(key, t, lat, lon):
+    ''' True when a cache key (t, lat, lon) is of sim time t and of the same
+        position arrays. The traffic arrays are reallocated when aircraft are
+        created or deleted, so their identity tells whether a cached result
+        still belongs to the same aircraft. '''
+    return t is not None and key is not None and key[0] == t and key[1] is lat and key[2] is lon
+
+def find_site(fname, sitepath):
+    ''' Return the path of a site file, looking in the site folder sitepath
+        when the name is not an existing path. The .json extension is optional. '''
+    for path in (fname, os.path.join(sitepath, fname)):
+        for candidate in (path, path + '.json'):
+            if os.path.isfile(candidate):
+                return os.path.abspath(candidate)
+    # Stack arguments may come in upper case
+    if os.path.isdir(sitepath):
+        for candidate in os.listdir(sitepath):
+            if candidate.lower() in (fname.lower(), fname.lower() + '.json'):
+                return os.path.abspath(os.path.join(sitepath, candidate))
+    return None
+
+def load_site(fname, sitepath=''):
+    ''' Load and compile a site file, or return the already compiled copy. '''
+    path = find_site(fname, sitepath)
+    if path is None:
+        raise FileNotFoundError(f'Site file {fname} not found in {sitepath or os.getcwd()}')
+    if path not in _sites:
+        with open(path) as f:
+            _sites[path] = Site(json.load(f))
+    return _sites[path]
+
+class Site:
+    ''' One or more airports with their protection zones, effector sites and
+        sensor sites, compiled into numpy arrays in one local east-north frame.
+        A site file holds a single airport, or a list of them under "airports".
+        All radii in the site file are in metres. '''
+    def __init__(self, cfg):
+        self.name = cfg['name']
+        airports = cfg.get('airports', [cfg])
+        self.airports = [apt['name'] for apt in airports]
+        self.latc = np.mean([apt['centre'][0] for apt in airports])
+        self.lonc = np.mean([apt['centre'][1] for apt in airports])
+
+        # Local east-north frame [m] of the site, all zone checks are done in this frame
+        self.frame = LocalFrame(self.latc, self.lonc)
+
+        self.zones = []         # Protection zones: (name, lat, lon, radius, color)
+        self.exclusions = []    # Effector exclusion polygons: (name, top, bottom, color, coords)
+        effectors, sensors = [], []
+        for apt in airports:
+            # Zone names get the airport name in front when there is more than one airport
+            prefix = apt['name'] if len(airports) > 1 else ''
+            latc, lonc = apt['centre']
+
+            # Zone circles: around each runway or around the airport centre
+            for letter, zone in apt['zones'].items():
+                if zone.get('around') == 'runways':
+                    for rwy, (lat, lon) in apt['runways'].items():
+                        self.zones.append((f'{prefix}ZONE{letter}{rwy}', lat, lon, zone['radius'], zone['color']))
+                else:
+                    self.zones.append((f'{prefix}ZONE{letter}', latc, lonc, zone['radius'], zone['color']))
+
+            # Polygon in which the effectors are not to be used
+            if 'exclusion' in apt:
+                excl = apt['exclusion']
+                self.exclusions.append((excl['name'], excl['top'], excl['bottom'], excl['color'],
+                                        tuple(tuple(coord) for coord in excl['coords'])))
+            effectors += apt.get('effectors', [])
+            sensors += apt.get('sensors', [])
+
+        # Effector and sensor sites
+        self.effnames = [eff['name'] for eff in effectors]
+        self.efflat = np.array([eff['lat'] for eff in effectors], dtype=float)
+        self.efflon = np.array([eff['lon'] for eff in effectors], dtype=float)
+        self.effradius = np.array([eff['radius'] for eff in effectors], dtype=float)
+        self.weapons = np.array([eff['weapon'] for eff in effectors])
+
+        self.sensnames = [sens['name'] for sens in sensors]
+        self.senslat = np.array([sens['lat'] for sens in sensors], dtype=float)
+        self.senslon = np.array([sens['lon'] for sens in sensors], dtype=float)
+        self.sensradius = np.array([sens['radius'] for sens in sensors], dtype=float)
+        self.senscolor = [sens['color'] for sens in sensors]
+        # Rotating antennas: time per revolution [s] and azimuth at t=0 [deg]
+        self.sensrotation = np.array([sens.get('rotation', 4.0) for sens in sensors], dtype=float)
+        self.sensazimuth = np.array([sens.get('azimuth', 0.0) for sens in sensors], dtype=float)
+
+        # Probability of detection of the sensors, shared by all airports of the site
+        self.sensor_model = SensorModel(cfg.get('sensor_model'))
+
+        # Effector circles with the exclusion polygons, and sensor circles
+        effx, effy = self.frame.project(self.efflat, self.efflon)
+        sensx, sensy = self.frame.project(self.senslat, self.senslon)
+        zlat, zlon, zradius = np.array([zone[1:4] for zone in self.zones], dtype=float).reshape(-1, 3).T
+        zx, zy = self.frame.project(zlat, zlon)
+        self.polygons = [Polygon(np.column_stack(self.frame.project(*np.array(coords).T)))
+                         for _, _, _, _, coords in self.exclusions]
+        self.effector_zones = ZoneSet(effx, effy, self.effradius, self.polygons)
+        self.sensor_zones = ZoneSet(sensx, sensy, self.sensradius)
+
+        # All zones of all airports together, for the spatial index and the coverage raster.
+        # Columns: effectors, sensors, protection zones, exclusion polygons
+        self.all_zones = ZoneSet(np.concatenate((effx, sensx, zx)), np.concatenate((effy, sensy, zy)),
+                                 np.concatenate((self.effradius, self.sensradius, zradius)), self.polygons)
+        self.all_names = self.effnames + self.sensnames + [zone[0] for zone in self.zones] + \
+            [excl[0] for excl in self.exclusions]
+        self.neff = len(self.effnames)
+        self.nsens = len(self.sensnames)
+        self.nzones = len(self.zones)
+
+        # Effector types, in the order of the columns of effector_groups()
+        self.weapon_types = list(dict.fromkeys(self.weapons))
+        # Zones of the coverage raster: effectors, sensors and exclusion polygons, without the
+        # large protection zones. Columns of each group of zones the consumers ask for.
+        self.raster_zones = ZoneSet(np.concatenate((effx, sensx)), np.concatenate((effy, sensy)),
+                                    np.concatenate((self.effradius, self.sensradius)), self.polygons)
+        self.raster_groups = [np.flatnonzero(self.weapons == weapon) for weapon in self.weapon_types] + \
+            [np.arange(self.neff + self.nsens, len(self.raster_zones)),
+             np.arange(self.neff, self.neff + self.nsens)]
+
+        # Spatial index over all zones, used by default when there is more than one airport
+        self.indexed = len(airports) > 1
+        self.grid = None
+
+        # Masks of the last tick, shared by all their consumers
+        self._exclkey = None
+        self._exclmask = None
+        self._allkey = None
+        self._allmask = None
+
+    def set_raster(self, cellsize):
+        ''' Build the coverage raster of the effector, sensor and exclusion zones with
+            the given cell size [m], or switch it off when cellsize is None or zero. '''
+        self.grid = CoverageGrid(self.raster_zones, cellsize) if cellsize else None
+        self.grid_masks = [self.grid.mask(cols) for cols in self.raster_groups] if cellsize else None
+
+    def set_index(self, flag):
+        ''' Switch the spatial index over all zones on or off. '''
+        self.indexed = flag
+        self._allkey = None
+
+    def membership(self, lat, lon, t=None):
+        ''' Membership matrix of all zones (columns as in all_names), from the
+            spatial index. Computed once per tick when the sim time t is given. '''
+        if not same_tick(self._allkey, t, lat, lon):
+            x, y = self.frame.project(lat, lon, t)
+            self._allkey, self._allmask = (t, lat, lon), self.all_zones.query(x, y)
+        return self._allmask
+
+    def exclusion_mask(self, lat, lon, t=None):
+        ''' Boolean mask of the aircraft inside any of the exclusion polygons.
+            Only aircraft within the bounding box of a polygon get the exact
+            test. When the sim time t is given, the mask is computed once per
+            tick and reused by every later call in the same tick. '''
+        if self.indexed:
+            return self.membership(lat, lon, t)[:, len(self.all_zones.cx):].any(axis=1)
+        if same_tick(self._exclkey, t, lat, lon):
+            return self._exclmask
+
+        x, y = self.frame.project(lat, lon, t)
+        mask = np.zeros(len(x), dtype=bool)
+        for polygon, bounds in zip(self.polygons, self.effector_zones.polybounds):
+            mask |= polygon_mask(polygon, bounds, x, y)
+
+        self._exclkey, self._exclmask = (t, lat, lon), mask
+        return mask
+
+    def effector_membership(self, lat, lon, t=None):
+        ''' N x (K + 1) membership matrix of the K effector circles, with the
+            exclusion polygon mask as last column. '''
+        if self.indexed:
+            inside = self.membership(lat, lon, t)[:, :self.neff]
+        else:
+            inside = self.effector_zones.circle_membership(*self.frame.project(lat, lon, t))
+        return np.column_stack((inside, self.exclusion_mask(lat, lon, t)))
+
+    def sensor_membership(self, lat, lon, t=None):
+        ''' N x S membership matrix of the sensor coverage circles. '''
+        if self.indexed:
+            return self.membership(lat, lon, t)[:, self.neff:self.neff + self.nsens]
+        return self.sensor_zones.circle_membership(*self.frame.project(lat, lon, t))
+
+    def effector_groups(self, lat, lon, t=None):
+        ''' N x (T + 1) matrix of the aircraft inside any zone of each effector
+            type (columns as in weapon_types), with the exclusion polygon mask as
+            last column. With the coverage raster on, this is the cell bits of
+            each aircraft ANDed with the bits of each type. '''
+        if self.grid is not None:
+            words = self.grid.bits(*self.frame.project(lat, lon, t))
+            return np.column_stack([(words & mask).any(axis=1) for mask in self.grid_masks[:-1]])
+        inside = self.effector_membership(lat, lon, t)
+        return np.column_stack([inside[:, cols].any(axis=1) for cols in self.raster_groups[:-2]] +
+                               [inside[:, -1]])
+
+    def sensor_coverage(self, lat, lon, t=None):
+        ''' Boolean mask of the aircraft inside the coverage circle of any sensor. '''
+        if self.grid is not None:
+            words = self.grid.bits(*self.frame.project(lat, lon, t))
+            return (words & self.grid_masks[-1]).any(axis=1)
+        return self.sensor_membership(lat, lon, t).any(axis=1)
+
+    def sensor_ranges(self, lat, lon, t=None):
+        ''' N x S matrix of the horizontal distances [m] to each sensor. '''
+        x, y = self.frame.project(lat, lon, t)
+        zones = self.sensor_zones
+        return np.hypot(np.asarray(x)[:, np.newaxis] - zones.cx, np.asarray(y)[:, np.newaxis] - zones.cy)
+
+    def sensor_polar(self, lat, lon, t=None):
+        ''' N x S matrices of the distances [m] and bearings [deg] from each sensor. '''
+        x, y = self.frame.project(lat, lon, t)
+        dx = np.asarray(x)[:, np.newaxis] - self.sensor_zones.cx
+        dy = np.asarray(y)[:, np.newaxis] - self.sensor_zones.cy
+        return np.hypot(dx, dy), np.degrees(np.arctan2(dx, dy)) % 360.0
+
+    def sensor_sweep(self, lat, lon, t0, t1):
+        ''' Targets painted by the rotating sensor antennas between the sim times
+            t0 and t1. Returns the target and sensor index of each plot, the time
+            the beam crossed the target, and the N x S distance matrix. '''
+        dist, brg = self.sensor_polar(lat, lon, t1)
+        omega = 360.0 / self.sensrotation
+        # Angle from the antenna azimuth at t0 to each target, in the direction of rotation
+        ahead = (brg - self.sensazimuth - omega * t0) % 360.0
+        painted = (ahead < omega * (t1 - t0)) & (dist < self.sensradius)
+        iac, isens = np.nonzero(painted)
+        return iac, isens, t0 + ahead[iac, isens] / omega[isens], dist
+
+    def effector_gap(self, lat, lon):
+        ''' Lower bound of the distance [m] to the nearest effector zone or exclusion polygon. '''
+        return self.effector_zones.gap(*self.frame.project(lat, lon))
+
+    def sensor_gap(self, lat, lon):
+        ''' Lower bound of the distance [m] to the nearest sensor coverage circle. '''
+        return self.sensor_zones.gap(*self.frame.project(lat, lon))
+
+    def zone_commands(self):
+        ''' Stack commands to draw the protection zones and the exclusion polygons. '''
+        cmds = [f'CIRCLE {name} {lat} {lon} {r/nm}' for name, lat, lon, r, _ in self.zones]
+        for name, top, bottom, _, coords in self.exclusions:
+            coords = ' '.join(f'{lat} {lon}' for lat, lon in coords)
+            cmds.append(f'POLYALT {name} {top} {bottom} {coords}')
+        cmds += [f'COLOR {name} {color}' for name, _, _, _, color in self.zones]
+        cmds += [f'COLOR {name} {color}' for name, _, _, color, _ in self.exclusions]
+        return cmds
+
+    def sensor_commands(self):
+        ''' Stack commands to draw the maximum detection range of each sensor. '''
+        cmds = [f'CIRCLE {name} {lat} {lon} {r/nm}' for name, lat, lon, r in
+                zip(self.sensnames, self.senslat, self.senslon, self.sensradius)]
+        cmds += [f'COLOR {name} {color}' for name, color in zip(self.sensnames, self.senscolor)]
+        return cmds
+
+class SensorModel:
+    ''' Probability of detection of a sensor as a function of the range to the
+        target, as a fraction of the sensor radius, and of the target altitude [m].
+        Both curves are piecewise linear tables, which can be given in the
+        "sensor_model" entry of a site file. Beyond the sensor radius the
+        probability is zero. The sensors only look once per scan period [s]. '''
+    def __init__(self, cfg=None):
+        cfg = cfg or {}
+        self.period = float(cfg.get('period', 1.0))
+        self.range = np.array(cfg.get('range', [0.0, 0.5, 1.0]), dtype=float)
+        self.pd_range = np.array(cfg.get('pd_range', [0.99, 0.9, 0.5]), dtype=float)
+        self.alt = np.array(cfg.get('alt', [0.0, 15.0, 3000.0]), dtype=float)
+        self.pd_alt = np.array(cfg.get('pd_alt', [0.3, 1.0, 1.0]), dtype=float)
+        self.sigma = float(cfg.get('sigma', 25.0))     # Plot position error [m]
+
+    def pd(self, dist, radius, alt):
+        ''' N x S probability of detection of N targets by S sensors, from the
+            N x S distance matrix, the sensor radii and the target altitudes. '''
+        frac = dist / radius
+        pd = np.where(frac <= 1.0, np.interp(frac, self.range, self.pd_range), 0.0)
+        return pd * np.interp(alt, self.alt, self.pd_alt)[:, np.newaxis]
+
+    def detect(self, dist, radius, alt, rng):
+        ''' Draw for each target whether at least one sensor detects it in this scan. '''
+        pmiss = np.prod(1.0 - self.pd(dist, radius, alt), axis=1)
+        return rng.random(len(pmiss)) >= pmiss
+
+class LocalFrame:
+    ''' Local east-north frame [m] centred at (latc, lonc). The metres per degree
+        of latitude and longitude are computed once, so projecting the traffic
+        is two multiply-adds per aircraft. The projection of the last tick is
+        cached, so all consumers in the same tick of the same traffic arrays share it. '''
+    def __init__(self, latc, lonc):
+        self.latc, self.lonc = latc, lonc
+        self.kn = np.radians(Rearth)                        # metres per degree latitude
+        self.ke = self.kn * np.cos(np.radians(latc))        # metres per degree longitude
+        self._key = None
+        self._xy = None
+
+    def project(self, lat, lon, t=None):
+        ''' East and north coordinates [m] of the given positions. When the sim
+            time t is given, the result is computed once per tick. '''
+        if same_tick(self._key, t, lat, lon):
+            return self._xy
+        x = (np.asarray(lon, dtype=float) - self.lonc) * self.ke
+        y = (np.asarray(lat, dtype=float) - self.latc) * self.kn
+        if t is not None:
+            self._key, self._xy = (t, lat, lon), (x, y)
+        return x, y
+
+    def unproject(self, x, y):
+        ''' Latitude and longitude of the given east and north coordinates [m]. '''
+        return np.asarray(y) / self.kn + self.latc, np.asarray(x) / self.ke + self.lonc
+
+class ZoneSet:
+    ''' Circles (centres and radii [m]) and polygons in a local frame, all checked
+        in one pass. Circles are squared-distance comparisons, polygons are
+        prepared and box-filtered. Columns of the membership matrix are the
+        circles first, followed by the polygons. '''
+    def __init__(self, cx, cy, r, polygons=()):
+        self.cx = np.asarray(cx, dtype=float)
+        self.cy = np.asarray(cy, dtype=float)
+        self.r = np.asarray(r, dtype=float)
+        self.r2 = self.r * self.r
+        self.polygons = np.array(polygons, dtype=object).reshape(-1)
+        shapely.prepare(self.polygons)
+        self.polybounds = shapely.bounds(self.polygons).reshape(-1, 4)
+
+        # Bounding circles of all zones, the polygons within their circumcircles
+        pcx, pcy = shapely.get_coordinates(shapely.centroid(self.polygons)).T.reshape(2, -1)
+        pr = [np.hypot(*(shapely.get_coordinates(poly) - (x, y)).T).max()
+              for poly, x, y in zip(self.polygons, pcx, pcy)]
+        self.bcx = np.append(self.cx, pcx)
+        self.bcy = np.append(self.cy, pcy)
+        self.br = np.append(self.r, pr)
+
+        # Spatial index of the bounding boxes of all zones
+        self.tree = shapely.STRtree(np.append(shapely.box(self.cx - self.r, self.cy - self.r,
+                                                          self.cx + self.r, self.cy + self.r),
+                                              self.polygons))
+
+    def __len__(self):
+        return len(self.cx) + len(self.polygons)
+
+    def circle_membership(self, x, y):
+        ''' N x C membership matrix of the circles only. '''
+        dx = np.asarray(x)[:, np.newaxis] - self.cx
+        dy = np.asarray(y)[:, np.newaxis] - self.cy
+        return dx * dx + dy * dy < self.r2
+
+    def membership(self, x, y, cols=None):
+        ''' N x K membership matrix of all zones, or of the zones in cols only. '''
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        cols = np.arange(len(self)) if cols is None else np.asarray(cols, dtype=int)
+        circ = cols < len(self.cx)
+        inside = np.empty((len(x), len(cols)), dtype=bool)
+
+        c = cols[circ]
+        dx = x[:, np.newaxis] - self.cx[c]
+        dy = y[:, np.newaxis] - self.cy[c]
+        inside[:, circ] = dx * dx + dy * dy < self.r2[c]
+        for m in np.flatnonzero(~circ):
+            p = cols[m] - len(self.cx)
+            inside[:, m] = polygon_mask(self.polygons[p], self.polybounds[p], x, y)
+        return inside
+
+    def query(self, x, y):
+        ''' N x K membership matrix of all zones, as membership(), from one query
+            of the spatial index for all points. Only the (point, zone) pairs with
+            overlapping bounding boxes get the exact test. '''
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        inside = np.zeros((len(x), len(self)), dtype=bool)
+        ipnt, izone = self.tree.query(shapely.points(x, y))
+
+        # Circle pairs are squared-distance checks, polygon pairs exact point-in-polygon
+        circ = izone < len(self.cx)
+        ip, iz = ipnt[circ], izone[circ]
+        dx, dy = x[ip] - self.cx[iz], y[ip] - self.cy[iz]
+        hit = dx * dx + dy * dy < self.r2[iz]
+        inside[ip[hit], iz[hit]] = True
+
+        ip, iz = ipnt[~circ], izone[~circ]
+        hit = shapely.contains_xy(self.polygons[iz - len(self.cx)], x[ip], y[ip])
+        inside[ip[hit], iz[hit]] = True
+        return inside
+
+    def classify(self, x0, y0, x1, y1):
+        ''' For the boxes [x0, x1] x [y0, y1], return two K x C masks: boxes
+            entirely inside each zone, and boxes that overlap it. '''
+        # Nearest and farthest distance from each circle centre to each box
+        cx, cy, r2 = self.cx[:, np.newaxis], self.cy[:, np.newaxis], self.r2[:, np.newaxis]
+        nx = np.maximum(np.maximum(x0 - cx, cx - x1), 0.0)
+        ny = np.maximum(np.maximum(y0 - cy, cy - y1), 0.0)
+        fx = np.maximum(np.abs(x0 - cx), np.abs(x1 - cx))
+        fy = np.maximum(np.abs(y0 - cy), np.abs(y1 - cy))
+        full = [fx * fx + fy * fy < r2]
+        touch = [nx * nx + ny * ny < r2]
+
+        boxes = shapely.box(x0, y0, x1, y1)
+        for poly in self.polygons:
+            full.append(shapely.contains_properly(poly, boxes)[np.newaxis])
+            touch.append(shapely.intersects(poly, boxes)[np.newaxis])
+        return np.concatenate(full), np.concatenate(touch)
+
+    def bounds(self, cols=None):
+        ''' Bounding box (xmin, ymin, xmax, ymax) of all zones, or of the zones in cols. '''
+        cols = slice(None) if cols is None else np.asarray(cols, dtype=int)
+        bcx, bcy, br = self.bcx[cols], self.bcy[cols], self.br[cols]
+        return (bcx - br).min(), (bcy - br).min(), (bcx + br).max(), (bcy + br).max()
+
+    def gap(self, x, y):
+        ''' Lower bound of the distance [m] of each point to the nearest zone,
+            zero when inside the bounding circle of a zone. '''
+        dx = np.asarray(x)[:, np.newaxis] - self.bcx
+        dy = np.asarray(y)[:, np.newaxis] - self.bcy
+        gap = (np.sqrt(dx * dx + dy * dy) - self.br).min(axis=1, initial=np.inf)
+        return np.maximum(gap, 0.0)
+
+def pack_bits(inside):
+    ''' Pack an N x K boolean matrix into N x W words of 64 bits, column k
+        is bit k % 64 of word k // 64. '''
+    n, k = inside.shape
+    padded = np.zeros((n, 64 * max(1, -(-k // 64))), dtype=bool)
+    padded[:, :k] = inside
+    return np.packbits(padded, axis=1, bitorder='little').view('<u8')
+
+class CoverageGrid:
+    ''' Precomputed raster over a set of zones. Each cell holds a bitmask of
+        the zones covering the whole cell, in words of 64 zones, and a flag for
+        cells crossed by a zone boundary. Only aircraft in those boundary cells
+        get the exact geometry test. Consumers AND the bits of each aircraft
+        with the mask of the zones they need, so the per-tick cost hardly
+        depends on the number of zones. The raster covers the given extent (by
+        default all zones); outside of it only the zones reaching beyond it are
+        tested. At most maxcells cells are allocated. '''
+    maxcells = 2000000
+    chunk = 16384       # Cells classified at once, bounds the memory of the build
+
+    def __init__(self, zones, cellsize, extent=None):
+        self.zones = zones
+        self.cellsize = cellsize
+        self.xmin, self.ymin, xmax, ymax = extent or zones.bounds()
+        self.outer = np.flatnonzero((zones.bcx - zones.br < self.xmin) | (zones.bcx + zones.br > xmax) |
+                                    (zones.bcy - zones.br < self.ymin) | (zones.bcy + zones.br > ymax))
+        self.nx = int(np.ceil((xmax - self.xmin) / cellsize))
+        self.ny = int(np.ceil((ymax - self.ymin) / cellsize))
+        ncells = self.nx * self.ny
+        if ncells > self.maxcells:
+            raise ValueError(f'Coverage raster of {self.nx}x{self.ny} cells is larger than '
+                             f'{self.maxcells} cells, use larger cells')
+
+        # All cells, row by row, classified in chunks
+        self.cells = np.zeros((ncells, max(1, -(-len(zones) // 64))), dtype='<u8')
+        self.edge = np.zeros(ncells, dtype=bool)
+        for start in range(0, ncells, self.chunk):
+            cell = np.arange(start, min(start + self.chunk, ncells))
+            i, j = np.divmod(cell, self.ny)
+            x0 = self.xmin + i * cellsize
+            y0 = self.ymin + j * cellsize
+            full, touch = zones.classify(x0, y0, x0 + cellsize, y0 + cellsize)
+            self.cells[cell] = pack_bits(full.T)
+            self.edge[cell] = (touch & ~full).any(axis=0)
+
+    def mask(self, cols):
+        ''' Bitmask words of the zones in cols, to AND with the words of bits(). '''
+        inside = np.zeros((1, len(self.zones)), dtype=bool)
+        inside[0, cols] = True
+        return pack_bits(inside)[0]
+
+    def bits(self, x, y):
+        ''' N x W bitmask words of the zones each point is in, zone k in bit k % 64 of word k // 64. '''
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        i = np.floor((x - self.xmin) / self.cellsize).astype(int)
+        j = np.floor((y - self.ymin) / self.cellsize).astype(int)
+        isin = (i >= 0) & (i < self.nx) & (j >= 0) & (j < self.ny)
+        ingrid = np.flatnonzero(isin)
+        cell = i[ingrid] * self.ny + j[ingrid]
+
+        words = np.zeros((len(x), self.cells.shape[1]), dtype='<u8')
+        words[ingrid] = self.cells[cell]
+
+        # Exact test for the aircraft in cells crossed by a zone boundary
+        edge = ingrid[self.edge[cell]]
+        if edge.size:
+            words[edge] = pack_bits(self.zones.membership(x[edge], y[edge]))
+
+        # Outside of the raster only the zones reaching beyond it need a test
+        out = np.flatnonzero(~isin)
+        if out.size and self.outer.size:
+            inside = np.zeros((len(out), len(self.zones)), dtype=bool)
+            inside[:, self.outer] = self.zones.membership(x[out], y[out], self.outer)
+            words[out] = pack_bits(inside)
+        return words
+
+    def membership(self, x, y):
+        ''' N x K membership matrix of all zones, as ZoneSet.membership(). '''
+        words = self.bits(x, y)
+        return np.unpackbits(words.view(np.uint8), axis=1, count=len(self.zones),
+                             bitorder='little').astype(bool)
+
+class ZoneScheduler:
+    ''' Schedules when each aircraft needs its next zone check. For every checked
+        aircraft a lower bound of the time needed to reach the nearest zone is
+        computed from its distance to that zone, its ground speed and a maximum
+        acceleration. The aircraft is not checked again before that time.
+        The due times are kept in a heap of (time, uid) entries, so the work per
+        tick scales with the number of aircraft close to a zone.
+        Aircraft are identified by a uid that increases with the aircraft index,
+        so uids can be turned into indices with a binary search. '''
+    def __init__(self, amax=2.5, maxinterval=30.0):
+        self.amax = amax                # Maximum acceleration assumed [m/s2]
+        self.maxinterval = maxinterval  # Maximum time between two checks [s]
+        self.heap = []
+
+    def reset(self, uids=(), t=0.0):
+        ''' Clear the schedule, and make the given aircraft due at time t. '''
+        self.heap = [(t, uid) for uid in uids]
+        heapq.heapify(self.heap)
+
+    def add(self, uids, due):
+        ''' Schedule the next check of the aircraft with the given uids. '''
+        due = np.broadcast_to(due, np.shape(uids))
+        if len(uids) > len(self.heap):
+            self.heap.extend(zip(due.tolist(), np.asarray(uids).tolist()))
+            heapq.heapify(self.heap)
+        else:
+            for entry in zip(due.tolist(), np.asarray(uids).tolist()):
+                heapq.heappush(self.heap, entry)
+
+    def pop_due(self, t, uids):
+        ''' Remove the aircraft due at time t from the schedule, and return
+            their indices in the sorted uid array of the current traffic. '''
+        due = []
+        while self.heap and self.heap[0][0] <= t:
+            due.append(heapq.heappop(self.heap)[1])
+        if not due:
+            return np.zeros(0, dtype=int)
+        # Deleted aircraft are not found any more, and are dropped
+        idx, found = uid_indices(uids, np.unique(due))
+        return idx[found]
+
+    def reschedule(self, uids, t, dt, gap, gs):
+        ''' Schedule the next check of the aircraft with the given uids from
+            their distance gap [m] to the nearest zone and ground speed gs [m/s].
+            Aircraft inside a zone are due again in the next tick of length dt. '''
+        gs = np.abs(gs)
+        # Time to cover gap when accelerating at amax from the current speed,
+        # half a tick earlier so rounding of the sim time never skips a tick
+        tmin = (np.sqrt(gs * gs + 2.0 * self.amax * gap) - gs) / self.amax
+        self.add(uids, t + np.clip(tmin - 0.5 * dt, 0.0, self.maxinterval))
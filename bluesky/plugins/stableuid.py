@@ -0,0 +1,38 @@
+# Stable aircraft numbers shared by the plugins
+
+import numpy as np
+from bluesky import core
+
+# The one StableUid entity of all plugins
+_uids = None
+
+def stable_uids():
+    ''' Return the shared StableUid entity, created at the first call. Plugins
+        call this before their own Entity __init__, so the numbers of new
+        aircraft are set before the create hooks of the plugin run. '''
+    global _uids
+    if _uids is None:
+        _uids = StableUid()
+    return _uids
+
+class StableUid(core.Entity):
+    ''' A number for each aircraft that never changes while it exists, and
+        increases with the aircraft index. Numbers are not reused until the
+        simulation is reset, so the uid array is sorted, and uids are turned
+        into indices with callsigns.uid_indices. '''
+    def __init__(self):
+        super().__init__()
+        with self.settrafarrays():
+            self.uid = np.array([], dtype=np.int64)
+        self.nextuid = 0
+
+    def create(self, n=1):
+        ''' Number the new aircraft. '''
+        super().create(n)
+        self.uid[-n:] = np.arange(self.nextuid, self.nextuid + n)
+        self.nextuid += n
+
+    def reset(self):
+        ''' Start numbering from zero again when simulation is reset. '''
+        super().reset()
+        self.nextuid = 0
@@ -0,0 +1,5 @@
+# The pure helper modules of the plugins are tested without a running BlueSky
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
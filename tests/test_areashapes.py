@@ -0,0 +1,39 @@
+import numpy as np
+
+from bluesky.plugins.areashapes import CompiledArea, AreaSet, EMPTY
+
+def traffic(n=20000, seed=1):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(51.8, 52.2, n), rng.uniform(3.8, 4.3, n), rng.uniform(0.0, 2000.0, n)
+
+def test_circle_matches_kwikdist():
+    lat, lon, alt = traffic()
+    circle = CompiledArea('circle', (52.0, 4.0), top=1000.0, bottom=0.0, radius=5.0)
+    inside = AreaSet([circle]).membership(lat, lon, alt)[:, 0]
+    dlat = np.radians(52.0 - lat)
+    dlon = np.radians(4.0 - lon)
+    cavelat = np.cos(np.radians(lat + 52.0) * 0.5)
+    dist = 6371000.0 * np.sqrt(dlat * dlat + dlon * dlon * cavelat * cavelat) / 1852.0
+    np.testing.assert_array_equal(inside, (dist <= 5.0) & (alt <= 1000.0))
+
+def test_polygon_and_other_shapes():
+    lat, lon, alt = traffic()
+    box = CompiledArea('poly', [52.0, 4.0, 52.1, 4.0, 52.1, 4.2, 52.0, 4.2])
+    band = CompiledArea('other', contains=lambda lat, lon, alt: alt > 1500.0)
+    inside = AreaSet([box, band]).membership(lat, lon, alt)
+    np.testing.assert_array_equal(inside[:, 0], (lat > 52.0) & (lat < 52.1) & (lon > 4.0) & (lon < 4.2))
+    np.testing.assert_array_equal(inside[:, 1], alt > 1500.0)
+
+def test_repeated_area_is_shared():
+    lat, lon, alt = traffic(100)
+    circle = CompiledArea('circle', (52.0, 4.0), radius=10.0)
+    areas = AreaSet([circle, circle, EMPTY])
+    assert len(areas.areas) == 2
+    inside = areas.membership(lat, lon, alt)
+    np.testing.assert_array_equal(inside[:, 0], inside[:, 1])
+    assert inside[:, 0].any()
+
+def test_empty_area_contains_nothing():
+    lat, lon, alt = traffic(100)
+    inside = AreaSet([EMPTY]).membership(lat, lon, alt)
+    assert inside.shape == (100, 1) and not inside.any()
@@ -0,0 +1,55 @@
+import os
+
+import numpy as np
+
+from bluesky.plugins.bufferedlog import BufferedLog
+
+def rows(fname):
+    with open(fname) as f:
+        return [line.rstrip('\n') for line in f if not line.startswith('#')]
+
+def test_rows_written_in_order(tmp_path):
+    log = BufferedLog('TESTLOG', 'TEST LOG\nheader', str(tmp_path), blocksize=4)
+    log.start('SCEN')
+    log.log(1.0, np.array(['A', 'B']), np.array([0.5, 1.5]))
+    log.log(2.0, np.array(['C', 'D', 'E']), np.array([2.5, 3.5, 4.5]))
+    log.close()
+    assert os.path.basename(log.fname).startswith('TESTLOG_SCEN_')
+    assert rows(log.fname) == ['1.000000,A,0.500000', '1.000000,B,1.500000', '2.000000,C,2.500000',
+                               '2.000000,D,3.500000', '2.000000,E,4.500000']
+    assert log.pop_errors() == []
+
+def test_flush_after_interval(tmp_path):
+    log = BufferedLog('TESTLOG', 'TEST LOG', str(tmp_path), interval=10.0)
+    log.start()
+    log.log(0.0, 'A')
+    log.flush(wait=True)
+    assert rows(log.fname) == ['0.000000,A']
+    log.log(5.0, 'B')
+    assert log.nrows == 1
+    log.log(16.0, 'C')
+    # The first buffered row is older than the interval, so the buffer is handed off
+    assert log.nrows == 0
+    log.close()
+    assert len(rows(log.fname)) == 3
+
+def test_nothing_logged_before_start(tmp_path):
+    log = BufferedLog('TESTLOG', 'TEST LOG', str(tmp_path))
+    log.log(0.0, 'A')
+    assert log.nrows == 0
+    log.close()
+    assert os.listdir(tmp_path) == []
+
+def test_write_errors_are_reported(tmp_path):
+    # The log path is a file, so the log file cannot be created
+    path = tmp_path / 'notadir'
+    path.write_text('')
+    log = BufferedLog('TESTLOG', 'TEST LOG', str(path))
+    log.start()
+    log.log(0.0, np.array(['A', 'B']))
+    log.close()
+    errors = log.pop_errors()
+    assert len(errors) == 2
+    assert 'cannot write' in errors[0]
+    assert '2 rows not written' in errors[1]
+    assert log.pop_errors() == []
@@ -0,0 +1,50 @@
+from bluesky.plugins.callsigns import allocator, CallsignAllocator, pair_indices, uid_indices
+
+def test_numbers_are_never_reused():
+    alloc = CallsignAllocator('T')
+    first = alloc.allocate(3)
+    second = alloc.allocate(2)
+    assert first.tolist() == [0, 1, 2]
+    assert second.tolist() == [3, 4]
+    assert alloc.callsigns(second) == ['T3', 'T4']
+
+def test_reset_starts_from_zero():
+    alloc = CallsignAllocator('T')
+    alloc.allocate(5)
+    alloc.reset()
+    assert alloc.allocate(1).tolist() == [0]
+
+def test_allocator_is_shared_per_prefix():
+    assert allocator('SHARED') is allocator('SHARED')
+    assert allocator('SHARED') is not allocator('OTHER')
+    start = allocator('SHARED').allocate(1)[0]
+    assert allocator('SHARED').allocate(1)[0] == start + 1
+
+def test_pair_indices():
+    idx, found = pair_indices(['D2', 'D0', 'D1'], [('D0', 'D2'), ('D1', 'D0')])
+    assert idx.tolist() == [[1, 0], [2, 1]]
+    assert found.all()
+
+def test_pair_indices_drops_stale_pairs():
+    ids = ['D0', 'D1', 'D2']
+    # D3 would sort beyond the last callsign
+    idx, found = pair_indices(ids, [('D1', 'D3'), ('D0', 'D2')])
+    assert idx.tolist() == [[0, 2]]
+    assert found.tolist() == [False, True]
+    # D11 would land on D2
+    idx, found = pair_indices(ids, [('D11', 'D1')])
+    assert len(idx) == 0 and not found.any()
+
+def test_pair_indices_empty():
+    idx, found = pair_indices([], [('D0', 'D1')])
+    assert idx.shape == (0, 2) and not found.any()
+    idx, found = pair_indices(['D0'], [])
+    assert idx.shape == (0, 2) and found.shape == (0,)
+
+def test_uid_indices():
+    uids = [3, 4, 7, 9]
+    idx, found = uid_indices(uids, [7, 3, 5, 12])
+    assert idx[found].tolist() == [2, 0]
+    assert found.tolist() == [True, True, False, False]
+    idx, found = uid_indices([], [1, 2])
+    assert not found.any()
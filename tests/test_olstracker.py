@@ -0,0 +1,51 @@
+import numpy as np
+
+from bluesky.plugins.olstracker import Tracker
+
+def paint(tracker, pos, vel, t0, t1, dt, rng, sigma=5.0):
+    ''' Feed one noisy plot per target every dt seconds, returns the true positions at t1. '''
+    for t in np.arange(t0, t1, dt):
+        z = pos + vel * t + rng.normal(0.0, sigma, pos.shape)
+        tracker.update(np.full(len(pos), t), z[:, 0], z[:, 1], np.arange(len(pos)))
+        tracker.prune(t)
+    return pos + vel * t1
+
+def test_confirms_one_track_per_target():
+    rng = np.random.default_rng(1)
+    pos = np.array([[0.0, 0.0], [2000.0, 0.0], [0.0, 3000.0]])
+    vel = np.array([[10.0, 0.0], [0.0, -15.0], [-5.0, 5.0]])
+    tracker = Tracker(r=5.0)
+    truth = paint(tracker, pos, vel, 0.0, 20.0, 1.0, rng)
+
+    x, y, label, trackid = tracker.positions(20.0)
+    assert sorted(label) == [0, 1, 2]
+    assert len(np.unique(trackid)) == 3
+    # Position and velocity converge on the true straight-line motion
+    err = np.hypot(x - truth[label, 0], y - truth[label, 1])
+    assert err.max() < 25.0
+    np.testing.assert_allclose(tracker.x[tracker.confirmed][np.argsort(label), 2:], vel, atol=3.0)
+
+def test_tentative_tracks_are_not_reported():
+    tracker = Tracker()
+    tracker.update([0.0], [100.0], [100.0], [7])
+    assert len(tracker) == 1
+    x, y, label, trackid = tracker.positions(0.0)
+    assert len(x) == 0
+
+def test_tracks_without_plots_are_pruned():
+    rng = np.random.default_rng(2)
+    tracker = Tracker(r=5.0, maxcoast=5.0)
+    paint(tracker, np.zeros((1, 2)), np.array([[10.0, 0.0]]), 0.0, 5.0, 1.0, rng)
+    assert len(tracker) == 1
+    tracker.prune(9.0)
+    assert len(tracker) == 1
+    tracker.prune(10.0)
+    assert len(tracker) == 0
+
+def test_plots_of_several_sensors_in_one_batch():
+    # Two sensors paint the same target in the same batch: one track, two hits per batch
+    tracker = Tracker(r=5.0)
+    for t in range(5):
+        tracker.update([t, t + 0.5], [10.0 * t, 10.0 * t + 5.0], [0.0, 0.0], [3, 3])
+    assert len(tracker) == 1
+    assert tracker.hits[0] == 10
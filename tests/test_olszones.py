@@ -0,0 +1,60 @@
+import os
+
+import numpy as np
+import pytest
+
+from bluesky.plugins.olszones import load_site, ZoneSet, CoverageGrid
+
+sitepath = os.path.join(os.path.dirname(__file__), '..', 'scenario', 'sites')
+
+def test_load_site_from_site_folder(monkeypatch, tmp_path):
+    # The site folder is used, not the working directory
+    monkeypatch.chdir(tmp_path)
+    site = load_site('wiii', sitepath)
+    assert site.name
+    assert load_site('WIII.json', sitepath) is site
+
+def test_load_site_missing(tmp_path):
+    with pytest.raises(FileNotFoundError, match='NOSITE'):
+        load_site('NOSITE', str(tmp_path))
+
+def test_tick_cache_follows_traffic_arrays():
+    site = load_site('WIII', sitepath)
+    lat = np.array([site.latc, site.latc + 1.0])
+    lon = np.array([site.lonc, site.lonc + 1.0])
+    for check in (site.membership, site.exclusion_mask, lambda *args: site.frame.project(*args)[0]):
+        # Same tick, same arrays: the cached result is reused
+        first = check(lat, lon, 10.0)
+        assert check(lat, lon, 10.0) is first
+        # Same tick and number of aircraft, but other aircraft: computed again
+        lat2, lon2 = lat[::-1].copy(), lon[::-1].copy()
+        np.testing.assert_array_equal(check(lat2, lon2, 10.0), check(lat2, lon2))
+
+def test_raster_groups_match_plain_pass():
+    site = load_site('WIII', sitepath)
+    rng = np.random.default_rng(1)
+    lat = site.latc + rng.uniform(-0.15, 0.15, 5000)
+    lon = site.lonc + rng.uniform(-0.15, 0.15, 5000)
+    site.set_raster(None)
+    groups, coverage = site.effector_groups(lat, lon), site.sensor_coverage(lat, lon)
+    try:
+        site.set_raster(100.0)
+        np.testing.assert_array_equal(site.effector_groups(lat, lon), groups)
+        np.testing.assert_array_equal(site.sensor_coverage(lat, lon), coverage)
+    finally:
+        site.set_raster(None)
+
+def test_raster_more_than_64_zones():
+    rng = np.random.default_rng(2)
+    zones = ZoneSet(rng.uniform(0, 20000, 150), rng.uniform(0, 20000, 150), rng.uniform(500, 2000, 150))
+    grid = CoverageGrid(zones, 200.0)
+    x, y = rng.uniform(-1000, 21000, (2, 5000))
+    np.testing.assert_array_equal(grid.membership(x, y), zones.membership(x, y))
+    # Zone 100 is in the second word
+    mask = grid.mask([100])
+    np.testing.assert_array_equal((grid.bits(x, y) & mask).any(axis=1), zones.membership(x, y)[:, 100])
+
+def test_raster_cell_cap():
+    zones = ZoneSet([0.0], [0.0], [50000.0])
+    with pytest.raises(ValueError, match='cells'):
+        CoverageGrid(zones, 1.0)
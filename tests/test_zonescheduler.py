@@ -0,0 +1,31 @@
+import numpy as np
+
+from bluesky.plugins.olszones import ZoneScheduler
+
+def test_new_aircraft_are_due_at_once():
+    sched = ZoneScheduler()
+    uids = np.array([3, 5, 8])
+    sched.reset(uids, 0.0)
+    assert sched.pop_due(0.0, uids).tolist() == [0, 1, 2]
+    # Popped aircraft are not due again until rescheduled
+    assert sched.pop_due(1.0, uids).tolist() == []
+
+def test_reschedule_from_gap_and_speed():
+    sched = ZoneScheduler(amax=2.0, maxinterval=30.0)
+    uids = np.array([0, 1, 2])
+    # Inside a zone, 100 m away at 10 m/s, and far away
+    sched.reschedule(uids, 0.0, 0.1, np.array([0.0, 100.0, 1e6]), np.array([10.0, 10.0, 10.0]))
+    assert sched.pop_due(0.0, uids).tolist() == [0]
+    # 100 m at 10 m/s accelerating at 2 m/s2 takes (sqrt(500) - 10) / 2 = 6.18 s
+    assert sched.pop_due(6.0, uids).tolist() == []
+    assert sched.pop_due(6.2, uids).tolist() == [1]
+    # Never later than maxinterval
+    assert sched.pop_due(29.9, uids).tolist() == []
+    assert sched.pop_due(30.0, uids).tolist() == [2]
+
+def test_deleted_aircraft_are_dropped():
+    sched = ZoneScheduler()
+    sched.add(np.array([1, 2, 4]), 0.0)
+    # Aircraft 2 is deleted, aircraft 7 created since
+    uids = np.array([1, 4, 7])
+    assert sched.pop_due(0.0, uids).tolist() == [0, 1]